@@ -0,0 +1,93 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from metrics import METRICS
+
+
+class AsyncExchange():
+    """
+    asyncio client over a BithumbExchange/KorbitExchange (or anything with
+    the same public methods).
+
+    get_states issues the ticker, recent transactions and, when the
+    exchange has depth_levels, the orderbook requests at the same time, so
+    an observation costs one round-trip instead of two or three in a row.
+    The result is the exchange's full state_schema(currency) layout, the
+    same as exchange.get_states. MarketFeed polls live exchanges through
+    it. Requests run on a thread pool, so the exchange's BASE_API_URL can
+    point at any HTTP server, e.g. a local stand-in for tests.
+    """
+    def __init__(self, exchange, max_workers=8):
+        self.exchange = exchange
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # event loop of run_states, kept between calls
+        self.loop = None
+
+    async def call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def get_ticker(self, currency_type=None):
+        return await self.call(self.exchange.get_ticker, currency_type)
+
+    async def get_recent(self, currency_type=None, count=10):
+        return await self.call(self.exchange.get_recent, currency_type, count)
+
+    async def get_orderbook(self, currency_type=None, count=10):
+        return await self.call(self.exchange.get_orderbook, currency_type, count)
+
+    async def poll(self, currency, depth=0):
+        """
+        async version of exchange.poll
+        depth: also fetch a depth level orderbook and apply it to exchange.books
+        """
+        exchange = self.exchange
+        while True:
+            requests = [self.get_ticker(currency),
+                    self.get_recent(currency, exchange.RECENT_COUNT)]
+            if depth > 0:
+                requests.append(self.get_orderbook(currency, depth))
+            results = await asyncio.gather(*requests)
+
+            ticker, recent = results[0], results[1]
+            if depth > 0:
+                exchange.apply_orderbook(currency, results[2])
+            if ticker is not None:
+                exchange.keep_ticker(currency, ticker)
+            if recent is not None:
+                matched = exchange.match_recent(currency, recent)
+                if matched is not None:
+                    return matched
+
+            await asyncio.sleep(exchange.POLL_INTERVAL)
+
+    async def get_states(self, currency, out=None):
+        """
+        write the exchange's state_schema(currency) states into out (allocated if None)
+        return last(float), volume(float), out like exchange.get_states
+        """
+        exchange = self.exchange
+        started = time.perf_counter()
+        ticker, recent = await self.poll(currency, exchange.depth_levels)
+        fetched = time.perf_counter()
+        if out is None:
+            out = exchange.state_schema(currency).allocate()
+        last, volume = exchange.featurize(currency, ticker, recent, exchange.books.get(currency), out)
+        METRICS.observe("fetch", fetched - started)
+        METRICS.observe("featurize", time.perf_counter() - fetched)
+        return last, volume, out
+
+    def run_states(self, currency, out=None):
+        """
+        blocking get_states for callers without an event loop,
+        always from the same thread
+        """
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(self.get_states(currency, out))
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
+        self.executor.shutdown(wait=False)
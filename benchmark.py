@@ -0,0 +1,274 @@
+import sys, getopt
+import json
+import time
+import random
+import platform
+from urllib.parse import urlsplit
+import numpy as np
+from bithumb import BithumbExchange
+from korbit import KorbitExchange
+from environment import Env
+from synthetic import SyntheticMarket
+
+
+class CannedResponses():
+    """
+    Exchange mixin answering http_get from a SyntheticMarket instead of the
+    network, after sleeping latency +- jitter seconds.
+    """
+    POLL_INTERVAL = 0
+    LIVE = False
+
+    def __init__(self, market, latency=0.0, jitter=0.0, seed=None):
+        self.market = market
+        self.latency = latency
+        self.jitter = jitter
+        self.random = np.random.RandomState(seed)
+        super().__init__()
+
+    def http_get(self, url):
+        delay = self.latency
+        if self.jitter > 0:
+            delay += self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        parts = urlsplit(url)
+        return self.market.response(self.EXCHANGE_NAME, parts.path, parts.query)
+
+
+class CannedBithumbExchange(CannedResponses, BithumbExchange):
+    EXCHANGE_NAME = "Bithumb"
+
+
+class CannedKorbitExchange(CannedResponses, KorbitExchange):
+    EXCHANGE_NAME = "Korbit"
+
+
+CANNED_EXCHANGES = { "Bithumb": CannedBithumbExchange, "Korbit": CannedKorbitExchange }
+
+
+def make_exchange(name, currency, latency=0.0, jitter=0.0, seed=None):
+    market = SyntheticMarket(currencies=[currency], seed=seed)
+    return CANNED_EXCHANGES[name](market, latency, jitter, seed)
+
+
+def latency_stats(samples):
+    """
+    samples in seconds to a dict of milliseconds
+    """
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    result = {}
+    result['count'] = int(len(ms))
+    result['mean_ms'] = float(ms.mean())
+    for q in (50, 90, 99):
+        result['p%d_ms' % q] = float(np.percentile(ms, q))
+    result['max_ms'] = float(ms.max())
+    return result
+
+
+def bench_get_states(name, currency, iterations, latency, jitter, seed, depth_levels=0, indicators=None):
+    exchange = make_exchange(name, currency, latency, jitter, seed)
+    exchange.configure(depth_levels, indicators)
+    out = exchange.state_schema(currency).allocate()
+    exchange.get_states(currency, out)
+
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        exchange.get_states(currency, out)
+        samples.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+
+    result = latency_stats(samples)
+    result['calls_per_sec'] = iterations / elapsed
+    return result
+
+
+def bench_env_step(name, currency, iterations, latency, jitter, seed, depth_levels, indicators):
+    exchange = make_exchange(name, currency, latency, jitter, seed)
+    env = Env(5000*10000, exchange=exchange, currency=currency, percent_per_trade=0.01,
+            depth_levels=depth_levels, indicators=indicators)
+    actions = random.Random(seed)
+    env.reset()
+
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        _, _, done, _ = env.step(actions.randint(0, env.action_size() - 1))
+        samples.append(time.perf_counter() - t)
+        if done:
+            env.reset()
+    elapsed = time.perf_counter() - started
+
+    result = latency_stats(samples)
+    result['steps_per_sec'] = iterations / elapsed
+    return result
+
+
+def bench_agent(name, currency, rollouts, latency, jitter, seed):
+    """
+    get_action, train_model and update_local_model cost per t_max rollout
+    """
+    from trade_a3c import A3CAgent, Agent
+
+    env = Env(5000*10000, exchange=make_exchange(name, currency, latency, jitter, seed),
+            currency=currency, percent_per_trade=0.01)
+    global_agent = A3CAgent(env)
+    agent = Agent(env, [global_agent.actor, global_agent.critic, global_agent.model], global_agent.sess,
+            global_agent.optimizer, global_agent.discount_factor, global_agent.store)
+
+    inference, train, sync = [], [], []
+    state = env.reset()
+    for _ in range(rollouts):
+        done = False
+        spent = 0.0
+        for _ in range(agent.t_max):
+            t = time.perf_counter()
+            action, _, value = agent.get_action(state)
+            spent += time.perf_counter() - t
+            next_state, reward, done, _ = env.step(action)
+            agent.append_sample(state, action, np.clip(reward, -1., 1.), value, done)
+            state = next_state
+            if done:
+                break
+
+        bootstrap = 0.0
+        if not done:
+            t = time.perf_counter()
+            bootstrap = agent.predict(state)[1]
+            spent += time.perf_counter() - t
+        inference.append(spent)
+
+        t = time.perf_counter()
+        agent.train_model(bootstrap)
+        train.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        agent.update_local_model()
+        sync.append(time.perf_counter() - t)
+
+        if done:
+            state = env.reset()
+
+    return { 'inference': latency_stats(inference), 'train': latency_stats(train),
+            'sync': latency_stats(sync) }
+
+
+def bench_a3c(name, currency, workers_list, seconds, latency, jitter, seed):
+    """
+    env steps/sec of all agents for each worker count, agents share one
+    MarketFeed like A3CAgent.train
+    """
+    from trade_a3c import A3CAgent, Agent
+
+    env = Env(5000*10000, exchange=make_exchange(name, currency, latency, jitter, seed),
+            currency=currency, percent_per_trade=0.01)
+    global_agent = A3CAgent(env)
+
+    results = []
+    for workers in workers_list:
+        agents = [Agent(env.fork(), [global_agent.actor, global_agent.critic, global_agent.model], global_agent.sess,
+                        global_agent.optimizer, global_agent.discount_factor, global_agent.store)
+                        for _ in range(workers)]
+        for agent in agents:
+            agent.daemon = True
+            agent.start()
+
+        # let every agent get through its first reset
+        time.sleep(1)
+        before = sum(agent.total_steps for agent in agents)
+        started = time.perf_counter()
+        time.sleep(seconds)
+        steps = sum(agent.total_steps for agent in agents) - before
+        elapsed = time.perf_counter() - started
+
+        for agent in agents:
+            agent.stop()
+        for agent in agents:
+            agent.join()
+
+        results.append({ 'workers': workers, 'steps': steps, 'seconds': elapsed,
+                'steps_per_sec': steps / elapsed })
+    return results
+
+
+# -e Bithumb,Korbit
+# -c BTC
+# -n 1000 (iterations)
+# -l 5 -j 1 (injected latency and jitter in ms per request)
+# -d 20 -i (orderbook depth levels, indicators)
+# -a (agent benchmarks, needs keras)
+# -w 1,2,4,8 -t 10 (A3C worker counts, seconds per count)
+# -s 0 (seed)
+# -o benchmark.json
+if __name__ == "__main__":
+    myopts, args = getopt.getopt(sys.argv[1:], "e:c:n:l:j:d:iaw:t:s:o:")
+    exchanges = ['Bithumb', 'Korbit']
+    currency = 'BTC'
+    iterations = 1000
+    latency = 0.0
+    jitter = 0.0
+    depth_levels = 0
+    indicators = None
+    agents = False
+    workers_list = [1, 2, 4, 8]
+    seconds = 10.0
+    seed = 0
+    output = None
+
+    for o, a in myopts:
+        if o == '-e':
+            exchanges = a.split(',')
+        elif o == '-c':
+            currency = a
+        elif o == '-n':
+            iterations = int(a)
+        elif o == '-l':
+            latency = float(a) / 1000
+        elif o == '-j':
+            jitter = float(a) / 1000
+        elif o == '-d':
+            depth_levels = int(a)
+        elif o == '-i':
+            indicators = {}
+        elif o == '-a':
+            agents = True
+        elif o == '-w':
+            workers_list = [int(w) for w in a.split(',')]
+        elif o == '-t':
+            seconds = float(a)
+        elif o == '-s':
+            seed = int(a)
+        elif o == '-o':
+            output = a
+        else:
+            print("Usage: %s [-e exchanges] [-c currency] [-n iterations] [-l latency_ms -j jitter_ms] [-d depth_levels] [-i] [-a -w workers -t seconds] [-s seed] [-o output]" % sys.argv[0])
+
+    report = {}
+    report['time'] = time.time()
+    report['python'] = platform.python_version()
+    report['numpy'] = np.__version__
+    report['params'] = { 'currency': currency, 'iterations': iterations,
+            'latency_ms': latency * 1000, 'jitter_ms': jitter * 1000,
+            'depth_levels': depth_levels, 'indicators': indicators is not None, 'seed': seed }
+
+    report['get_states'] = {}
+    report['env_step'] = {}
+    for name in exchanges:
+        report['get_states'][name] = bench_get_states(name, currency, iterations, latency, jitter, seed,
+                depth_levels, indicators)
+        report['env_step'][name] = bench_env_step(name, currency, iterations, latency, jitter, seed,
+                depth_levels, indicators)
+
+    if agents:
+        report['agent'] = bench_agent(exchanges[0], currency, max(1, iterations // 20), latency, jitter, seed)
+        report['a3c'] = bench_a3c(exchanges[0], currency, workers_list, seconds, latency, jitter, seed)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output is None:
+        print(text)
+    else:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
@@ -1,15 +1,13 @@
-import requests
 import time
 import datetime
 import math
-from exchange import Exchange
-import configparser
-import json
+from exchange import Exchange, make_ticker_table
+from ringbuffer import TimeRing
+from schema import StateSchema
 import base64
 import hashlib
 import hmac
 import urllib
-import numpy as np
 from collections import OrderedDict
 
 class BithumbExchange(Exchange):
@@ -22,22 +20,30 @@ class BithumbExchange(Exchange):
             "BTG": 50, "EOS": 5, "ICX": 1, "VEN": 1, "TRX": 1, "ELF": 1,
             "MCO": 5, "MITH": 1, "OMG": 10, "KNC": 1}
 
-    QUERY_RUNNING = False
+    # states written by build_states
+    STATE_SCHEMA = StateSchema([("last", 1), ("bid", 1), ("ask", 1), ("high", 1),
+            ("low", 1), ("volume", 1), ("trade_side", 1)])
+
+    CONFIG_SECTION = "BITHUMB"
+    FEE_PERCENT = 0.15
+    # seconds between polls while waiting for a new trade
+    POLL_INTERVAL = 0.3
+    # recent transactions needed by match_recent
+    RECENT_COUNT = 1
+    # tickers kept per currency to align with trades
+    TICKER_CAPACITY = 256
+    # oldest ticker accepted for a trade, before the trade's second
+    TICKER_MAX_LAG_MS = 1000
 
     def __init__(self):
-        config = configparser.ConfigParser()
-        config.read('config/config.ini')
-        self.CLIENT_ID = config['BITHUMB']['connect_key']
-        self.CLIENT_SECRET = config['BITHUMB']['secret_key']
-        self.USER_NAME = config['BITHUMB']['username']
+        super().__init__()
         self.data_count = 20
-        self.old_records = []
         self.prev_ticker = {}
-        self.ticker_list = []
-        self.prev_recent = {}
+        # per currency, polls of different currencies may run at the same time
+        self.ticker_rings = {}
+        self.prev_recents = {}
 
     def reset(self):
-        # self.old_records.clear()
         # self.prev_ticker = {}
         pass
 
@@ -49,27 +55,42 @@ class BithumbExchange(Exchange):
 
         ticker_api_path = "/public/ticker/{currency}".format(currency=currency_type)
         url_path = self.BASE_API_URL + ticker_api_path
-        res = requests.get(url_path)
-        try:
-            response_json = res.json()
-        except json.decoder.JSONDecodeError as e:
-            print(e)
+        response_json = self.http_get(url_path)
+        if response_json is None:
             return None
-        else:
-            result={}
-            result["timestamp"] = str(response_json['data']["date"])
-            result["start"] = response_json['data']["opening_price"]
-            result["last"] = response_json['data']["closing_price"]
-            result["bid"] = response_json['data']["buy_price"]
-            result["ask"] = response_json['data']["sell_price"]
-            result["high"] = response_json['data']["max_price"]
-            result["low"] = response_json['data']["min_price"]
-            result["average"] = response_json['data']["average_price"]
-            result["volume"] = response_json['data']["volume_1day"]
-            # units same to volume
-            # result["units"] = response_json['data']["units_traded"]
-            result["volume7"] = response_json['data']["volume_7day"]
-            return result
+
+        return self.parse_ticker(response_json['data'], response_json['data']["date"])
+
+    @staticmethod
+    def parse_ticker(data, date):
+        result={}
+        result["timestamp"] = str(date)
+        result["start"] = data["opening_price"]
+        result["last"] = data["closing_price"]
+        result["bid"] = data["buy_price"]
+        result["ask"] = data["sell_price"]
+        result["high"] = data["max_price"]
+        result["low"] = data["min_price"]
+        result["average"] = data["average_price"]
+        result["volume"] = data["volume_1day"]
+        # units same to volume
+        # result["units"] = data["units_traded"]
+        result["volume7"] = data["volume_7day"]
+        return result
+
+    def get_all_tickers(self):
+        ticker_api_path = "/public/ticker/ALL"
+        url_path = self.BASE_API_URL + ticker_api_path
+        response_json = self.http_get(url_path)
+        if response_json is None:
+            return None
+
+        data = response_json['data']
+        tickers = []
+        for currency in self.TRADE_CURRENCY_TYPE:
+            if currency in data:
+                tickers.append((currency, self.parse_ticker(data[currency], data["date"])))
+        return make_ticker_table(tickers)
 
     def get_orderbook(self, currency_type=None, count=10):
         if currency_type is None:
@@ -80,18 +101,15 @@ class BithumbExchange(Exchange):
         orderbook_api_path = \
                 "/public/orderbook/{currency}?count={count}".format(currency=currency_type, count=count)
         url_path = self.BASE_API_URL + orderbook_api_path
-        res = requests.get(url_path)
-        try:
-            response_json = res.json()
-        except json.decoder.JSONDecodeError as e:
-            print(e)
+        response_json = self.http_get(url_path)
+        if response_json is None:
             return None
-        else:
-            result={}
-            result["timestamp"] = str(response_json['data']["timestamp"])
-            result["bids"] = response_json['data']['bids']
-            result["asks"] = response_json['data']['asks']
-            return result
+
+        result={}
+        result["timestamp"] = str(response_json['data']["timestamp"])
+        result["bids"] = response_json['data']['bids']
+        result["asks"] = response_json['data']['asks']
+        return result
 
     def get_recent(self, currency_type=None, count=10):
         if currency_type is None:
@@ -102,62 +120,19 @@ class BithumbExchange(Exchange):
         recent_api_path = \
                 "/public/recent_transactions/{currency}?count={count}".format(currency=currency_type, count=count)
         url_path = self.BASE_API_URL + recent_api_path
-        res = requests.get(url_path)
-        try:
-            response_json = res.json()
-        except json.decoder.JSONDecodeError as e:
-            print(e)
+        response_json = self.http_get(url_path)
+        if response_json is None:
             return None
-        else:
-            result = response_json['data']
+
+        result = response_json['data']
         return result
 
     def get_fee(self):
-        return 0.15
-
-    def records_to_states(self):
-        states = []
-
-        prev_volume = 0.0
-        for record in self.old_records:
-            start = float(record['start'])
-            last = float(record['last']) / start
-            states.append(last)
-            bid = float(record['bid']) / start
-            states.append(bid)
-            ask = float(record['ask']) / start
-            states.append(ask)
-            high = float(record['high']) / start
-            states.append(high)
-            low = float(record['low']) / start
-            states.append(low)
-            volume = float(record['volume'])
-            if prev_volume != 0.0:
-                volume = volume - prev_volume
-            else:
-                volume = 0.0
-            states.append(volume)
-            prev_volume = volume
-
-        return states
-
-    def ticker_to_states(self, record):
-        states = []
-
-        start = float(record['start'])
-        last = float(record['last']) / start
-        states.append(last)
-        bid = float(record['bid']) / start
-        states.append(bid)
-        ask = float(record['ask']) / start
-        states.append(ask)
-        high = float(record['high']) / start
-        states.append(high)
-        low = float(record['low']) / start
-        states.append(low)
-
-        return states
-    
+        return self.FEE_PERCENT
+
+    def tick_size(self, currency):
+        return self.TRADE_UNIT.get(currency)
+
     def get_new_ticker(self, currency):
         time.sleep(1)
         ticker = self.get_ticker(currency)
@@ -169,87 +144,120 @@ class BithumbExchange(Exchange):
 
         return ticker
 
-    def find_ticker_for_recent(self, recent):
-        recent_date = recent['transaction_date']
-        ticker_index = 0
-        for ticker in self.ticker_list:
-            ticker_date = ticker['date']
-            if ticker_date == recent_date:
-                self.ticker_list = self.ticker_list[ticker_index+1: ]
-                return (ticker, ticker_index)
-            ticker_index = ticker_index + 1
+    @staticmethod
+    def trade_time_ms(transaction_date):
+        """
+        'YYYY-MM-DD HH:MM:SS' (local time, like the ticker timestamp) to epoch ms
+        """
+        s = transaction_date
+        date = datetime.datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                int(s[11:13]), int(s[14:16]), int(s[17:19]))
+        return int(date.timestamp()) * 1000
+
+    def find_ticker_for_recent(self, currency, recent):
+        """
+        as-of join: newest kept ticker at or before the trade's second,
+        at most TICKER_MAX_LAG_MS older than it
+        """
+        ring = self.ticker_rings.get(currency)
+        if ring is None:
+            return None
 
-        return (None, ticker_index)
+        trade_ms = self.trade_time_ms(recent['transaction_date'])
+        # transaction_date has second resolution
+        found = ring.asof(trade_ms + 999)
+        if found is None:
+            return None
 
-    def get_states(self, currency):
-        while self.QUERY_RUNNING is True:
-            time.sleep(0.3)
+        index, ticker_ms, ticker = found
+        if ticker_ms < trade_ms - self.TICKER_MAX_LAG_MS:
+            return None
+        ring.drop_through(index)
+        return ticker
 
-        self.QUERY_RUNNING = True
+    def keep_ticker(self, currency, ticker):
+        ring = self.ticker_rings.get(currency)
+        if ring is None:
+            ring = TimeRing(self.TICKER_CAPACITY)
+            self.ticker_rings[currency] = ring
+        ring.push(int(ticker['timestamp']), ticker)
+
+    def match_recent(self, currency, recent_list):
+        """
+        return (ticker, recent) if recent_list holds a new trade with a kept ticker, otherwise None
+        """
+        recent = recent_list[0]
+        prev_recent = self.prev_recents.get(currency)
+        ticker = None
+        if prev_recent is None or recent['cont_no'] != prev_recent['cont_no']:
+            ticker = self.find_ticker_for_recent(currency, recent)
 
-        found_recent = False
-        ticker = {}
-        recent = {}
+        self.prev_recents[currency] = recent
+        if ticker is None:
+            return None
+        return ticker, recent
 
-        while found_recent is False:
-            ticker = self.get_ticker(currency)
-            if ticker is None:
-                time.sleep(0.3)
-                continue
-            ticker_date = datetime.datetime.fromtimestamp(int(ticker['timestamp'])/1000).strftime('%Y-%m-%d %H:%M:%S')
-            ticker['date'] = ticker_date
-            self.ticker_list.append(ticker)
-
-            recent_list = self.get_recent(currency, 1)
-            if recent_list is None:
-                time.sleep(0.3)
-                continue
-            recent = recent_list[0]
-            if len(self.prev_recent.keys()) == 0:
-                ticker, ticker_index = self.find_ticker_for_recent(recent)
-                if ticker is not None:
-                    found_recent = True
-            elif recent['cont_no'] != self.prev_recent['cont_no']:
-                ticker, ticker_index = self.find_ticker_for_recent(recent)
-                if ticker is not None:
-                    found_recent = True
-
-            self.prev_recent = recent
-            time.sleep(0.3)
-
-        self.QUERY_RUNNING = False
-
-        # make states from ticker, recent
-        # states
+    def poll_once(self, currency):
+        """
+        one ticker and recent fetch, no waiting
+        return (ticker, recent) if there was a new trade with a kept ticker, otherwise None
+        """
+        ticker = self.get_ticker(currency)
+        if ticker is None:
+            return None
+        self.keep_ticker(currency, ticker)
+
+        recent_list = self.get_recent(currency, self.RECENT_COUNT)
+        if recent_list is None:
+            return None
+        return self.match_recent(currency, recent_list)
+
+    def poll(self, currency):
+        """
+        return (ticker, recent) for the newest trade and the ticker seen at its time
+        """
+        matched = self.poll_once(currency)
+        while matched is None:
+            time.sleep(self.POLL_INTERVAL)
+            matched = self.poll_once(currency)
+
+        return matched
+
+    @staticmethod
+    def build_states(ticker, recent, out):
+        """
+        write states made from ticker, recent into out[:STATE_SCHEMA.size]
+        return last(float), volume(float)
+        """
+        o = BithumbExchange.STATE_SCHEMA.offsets
 
         start = float(ticker['start'])
-        # last = float(ticker['last'])/start
-        last = float(recent['price'])/start
-        bid = float(ticker['bid'])/start
-        ask = float(ticker['ask'])/start
-        high = float(ticker['high'])/start
-        low = float(ticker['low'])/start
+        # out[o['last']] = float(ticker['last'])/start
+        out[o['last']] = float(recent['price'])/start
+        out[o['bid']] = float(ticker['bid'])/start
+        out[o['ask']] = float(ticker['ask'])/start
+        out[o['high']] = float(ticker['high'])/start
+        out[o['low']] = float(ticker['low'])/start
         volume = float(recent['units_traded'])
-        recent_type = 1 if recent['type'] == 'bid' else -1
-
-        states = []
-        states.append(last)
-        states.append(bid)
-        states.append(ask)
-        states.append(high)
-        states.append(low)
-        states.append(volume)
-        states.append(recent_type)
+        out[o['volume']] = volume
+        out[o['trade_side']] = 1 if recent['type'] == 'bid' else -1
 
         last = float(ticker['last'])
-        return last, volume, states
+        return last, volume
+
+    @staticmethod
+    def parse_trade(recent):
+        """
+        return price(float), units(float), side(1: bid, -1: ask) of a polled recent
+        """
+        side = 1 if recent['type'] == 'bid' else -1
+        return float(recent['price']), float(recent['units_traded']), side
 
 
 if __name__ == "__main__":
     bitThumbExchange = BithumbExchange()
     # print("get_ticker results ------------------")
-    # for n in bitThumbExchange.TRADE_CURRENCY_TYPE:
-    #     print(n, " --> ", bitThumbExchange.get_ticker(n))
+    # print(bitThumbExchange.get_all_tickers())
     # print("get_orderbook results ------------------")
     # for n in bitThumbExchange.TRADE_CURRENCY_TYPE:
     #     print(n, " --> ", bitThumbExchange.get_orderbook(n, 10))
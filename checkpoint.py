@@ -0,0 +1,93 @@
+import os
+import glob
+import time
+import pickle
+import logging
+import threading
+
+logger = logging.getLogger("m2bitcoin.checkpoint")
+
+
+class Checkpointer(threading.Thread):
+    """
+    Writes in-memory snapshots (plain dicts of numpy arrays and numbers) to
+    directory on a background thread, so training never waits on the disk.
+
+    A file is written under a temporary name and renamed into place, a crash
+    leaves the previous checkpoints intact. Only the newest keep files are
+    kept. A snapshot handed in while one is being written replaces any older
+    pending one.
+    """
+    PATTERN = "checkpoint-*.pkl"
+
+    def __init__(self, directory, keep=5):
+        threading.Thread.__init__(self, daemon=True)
+        self.directory = directory
+        self.keep = keep
+        self.cond = threading.Condition()
+        self.pending = None
+        self.stopped = False
+        os.makedirs(directory, exist_ok=True)
+
+    def snapshot(self, state):
+        with self.cond:
+            self.pending = state
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        self.join()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.stopped:
+                    self.cond.wait()
+                state, self.pending = self.pending, None
+                stopped = self.stopped
+            if state is not None:
+                try:
+                    self.write(state)
+                except Exception as e:
+                    logger.error("checkpoint failed: %s", e)
+            if stopped:
+                return
+
+    def write(self, state):
+        # milliseconds keep the names in write order
+        path = os.path.join(self.directory, "checkpoint-%013d.pkl" % int(time.time() * 1000))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        logger.info("checkpoint %s", path)
+        self.prune()
+        return path
+
+    def prune(self):
+        paths = checkpoints(self.directory)
+        for path in paths[:-self.keep]:
+            os.remove(path)
+
+
+def checkpoints(directory):
+    """
+    checkpoint paths in directory, oldest first
+    """
+    return sorted(glob.glob(os.path.join(directory, Checkpointer.PATTERN)))
+
+
+def latest(directory):
+    paths = checkpoints(directory)
+    if len(paths) == 0:
+        return None
+    return paths[-1]
+
+
+def load(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
@@ -1,17 +1,24 @@
 import time
-import numpy as np
+import logging
 import math
-#  from exchange import Exchange
-from bithumb import BithumbExchange
-from korbit import KorbitExchange
+from exchange import Exchange
+from exchanges import create_exchange
+from feed import MarketFeed
+from ringbuffer import ObservationWindow
+from indicators import IndicatorPipeline
+from schema import STATE_DTYPE
+from metrics import METRICS
 
+logger = logging.getLogger("m2bitcoin.env")
 
 DO_NOTHING = 0
 BUY = 1
 SELL = 2
 
 class Env():
-    def __init__(self, initial_investment, exchange="Bithumb", currency="BTC", percent_per_trade=0.05):
+    def __init__(self, initial_investment, exchange="Bithumb", currency="BTC", percent_per_trade=0.05,
+            capture=None, speed=0.0, feed=None, depth_levels=0, indicators=None,
+            history=1):
         """
         initial_investment: 초기 투자금
         cash_asset: 보유 현금
@@ -21,15 +28,28 @@ class Env():
         cash_per_trade: 한번 거래에 사용하는 현금
         fee_percent: 수수료 비율
         earning_rate: 현재 수익률
+        capture: exchange="Replay" 일 때 재생할 capture 파일
+        speed: Replay 재생 속도 (1.0 실시간, N 배속, 0 최대 속도)
+        feed: 공유 MarketFeed 의 FeedSubscription, 있으면 exchange 대신 시세를 받음
+        depth_levels: states 에 붙일 호가 grid 단계 수 (매수/매도 각각), 0 이면 사용 안함
+        indicators: states 에 붙일 지표의 IndicatorPipeline 인자 dict ({} 이면 기본값), None 이면 사용 안함
+        history: reset/step 이 돌려주는 최근 state 개수, 1 보다 크면 (history, state_size) 배열
         """
 
-        self.exchange = None
-        if exchange == "Bithumb":
-            self.exchange = BithumbExchange()
-        elif exchange == "Korbit":
-            self.exchange = KorbitExchange()
+        if isinstance(exchange, Exchange):
+            # shared instances keep their features, a conflicting request raises
+            self.exchange = exchange
+            self.exchange.configure(depth_levels, indicators)
+        elif exchange == "Replay":
+            self.exchange = create_exchange(exchange, depth_levels, indicators,
+                    capture_path=capture, speed=speed)
+        else:
+            self.exchange = create_exchange(exchange, depth_levels, indicators)
 
         self.currency = currency
+        self.feed = feed
+        # market data source: own exchange or the shared poller
+        self.source = self.exchange if feed is None else feed
 
         # account information
         self.initial_investment = initial_investment
@@ -37,14 +57,27 @@ class Env():
         self.average_cost = 0
         self.buy_count = 0.0
         self.current_price = 0
+        self.percent_per_trade = percent_per_trade
         self.cash_per_trade = self.initial_investment * percent_per_trade
         self.fee_percent = self.exchange.get_fee()
         self.earning_rate = 0.0
         self.fee_sum = 0
         self.done = False
 
-        _, states = self.get_states()
-        self.states_size = len(states)
+        # exchange states then the account features added by get_states,
+        # declared up front so no observation is needed to know the size
+        self.schema = self.exchange.state_schema(currency).extend([("average_cost", 1)])
+        self.states_size = self.schema.size
+        # get_states alternates between two buffers, so the states returned by
+        # the previous step stay valid while the next one is written
+        self.buffers = self.schema.allocate(2)
+        self.exchange_buffers = [self.buffers[i, :self.schema.offset("average_cost")] for i in range(2)]
+        self.buffer_index = 0
+
+        self.history = history
+        self.window = None
+        if history > 1:
+            self.window = ObservationWindow(history, self.states_size, dtype=STATE_DTYPE)
         self.action_dict = { DO_NOTHING: "DoNothing", BUY: "Buy", SELL: "Sell" }
 
     def reset(self):
@@ -58,10 +91,23 @@ class Env():
         self.earning_rate = 0.0
         self.fee_sum = 0
         self.done = False
-        self.exchange.reset()
+        self.source.reset()
 
         self.current_price, states = self.get_states()
-        return states
+        return self.observation(states, reset=True)
+
+    def observation(self, states, reset=False):
+        """
+        states of this step, or the last history states as one (history, state_size) array
+        """
+        if self.window is None:
+            return states
+        if reset:
+            self.window.fill(states)
+        else:
+            self.window.push(states)
+        # the window is overwritten by the next step, callers keep a copy
+        return self.window.view().copy()
 
     def calc_earning_rate(self):
         # earning_rate = ((self.average_cost * self.buy_count + self.cash_asset) - self.initial_investment) / self.initial_investment
@@ -78,7 +124,7 @@ class Env():
         self.earning_rate = earning_rate
 
         if reward != 0.0:
-            print("REWARD ==================> ", reward)
+            logger.debug("reward %s", reward)
 
         return reward
 
@@ -170,6 +216,7 @@ class Env():
         # time.sleep(3)
 
         self.current_price, states = self.get_states()
+        started = time.perf_counter()
         reward = 0.0
         info = {}
 
@@ -203,16 +250,51 @@ class Env():
         # print("calculate investment -> ", total_asset + total_cost)
         # print("initial_investment ---> ", self.initial_investment)
         #
-        print(info)
+        # building the repr is not free, skip it unless it is logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s", info)
 
         if self.earning_rate < -0.03:
             self.done = True
+        METRICS.observe("env", time.perf_counter() - started)
+
+        return self.observation(states), reward, self.done, info
 
-        return states, reward, self.done, info
+    def state_dict(self):
+        """
+        the exchange's indicator state, for checkpoints
+        indicators live on the exchange, shared by the Envs forked from this
+        one; accounts are not kept, every agent resets its fork when it starts
+        """
+        state = {}
+        state['indicators'] = {currency: pipeline.state_dict()
+                for currency, pipeline in self.exchange.pipelines.items()}
+        return state
+
+    def load_state_dict(self, state):
+        if self.exchange.indicator_config is None:
+            return
+        for currency, pipeline_state in state['indicators'].items():
+            pipeline = self.exchange.pipelines.get(currency)
+            if pipeline is None:
+                pipeline = IndicatorPipeline(**self.exchange.indicator_config)
+                self.exchange.pipelines[currency] = pipeline
+            pipeline.load_state_dict(pipeline_state)
+
+    def fork(self):
+        """
+        return a new Env with its own account, fed by the shared poller of this exchange/currency
+        """
+        feed = MarketFeed.get(self.exchange, self.currency)
+        return Env(self.initial_investment, exchange=self.exchange, currency=self.currency,
+                percent_per_trade=self.percent_per_trade, feed=feed.subscribe(), history=self.history)
 
     def state_size(self):
         return self.states_size
 
+    def history_size(self):
+        return self.history
+
     def action_size(self):
         # 0: do nothing, 1: buy, 2: sell
         return 3
@@ -227,13 +309,15 @@ class Env():
         #     else:
         #         time.sleep(1)
 
-        last, volume, states = self.exchange.get_states(self.currency)
+        self.buffer_index ^= 1
+        states = self.buffers[self.buffer_index]
+        last, volume, _ = self.source.get_states(self.currency, self.exchange_buffers[self.buffer_index])
 
         # average_cost
         val = self.average_cost
         if self.average_cost > 0:
             val = val/last
-        states.append(val)
+        states[self.schema.offset("average_cost")] = val
 
         # cash percent
         # val = self.cash_asset / self.initial_investment
@@ -246,9 +330,8 @@ class Env():
         #     margin = last / self.current_price
         # states.append(margin)
 
-        states = np.array(states)
-
-        print(states)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("states %s", states)
         return last, states
 
 
@@ -1,10 +1,378 @@
 from abc import ABC, abstractmethod
+import json
+import time
+import logging
+import configparser
+import threading
+from urllib.parse import urlsplit
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from orderbook import OrderBook, OrderbookFeaturizer
+from indicators import IndicatorPipeline
+from metrics import METRICS
+
+logger = logging.getLogger("m2bitcoin.exchange")
+
+
+# one row per currency of get_all_tickers()
+TICKER_DTYPE = np.dtype([
+    ("currency", "U8"),
+    ("timestamp", np.int64),
+    ("last", np.float64),
+    ("bid", np.float64),
+    ("ask", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("volume", np.float64),
+])
+
+
+def make_ticker_table(tickers):
+    """
+    tickers: list of (currency, get_ticker() result)
+    return structured array of TICKER_DTYPE
+    """
+    table = np.zeros(len(tickers), dtype=TICKER_DTYPE)
+    for i, (currency, ticker) in enumerate(tickers):
+        table[i] = (currency, int(ticker['timestamp']), float(ticker['last']),
+                float(ticker['bid']), float(ticker['ask']), float(ticker['high']),
+                float(ticker['low']), float(ticker['volume']))
+    return table
+
+
+class SingleFlight():
+    """
+    Runs at most one call per key at a time. Callers arriving while the call
+    for their key is in flight wait for it and receive its result (or error)
+    instead of issuing their own.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = FlightCall()
+                self.calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+class FlightCall():
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
 
 class Exchange(ABC):
+    # keep-alive connections kept per host
+    POOL_SIZE = 10
+    # seconds to connect and to wait for a response, a stale pooled
+    # connection must not hang the poller
+    TIMEOUT = 5.0
+
+    # shared by every exchange instance: host -> requests.Session
+    sessions = {}
+    sessions_lock = threading.Lock()
+    # endpoint -> [requests, reused connections]
+    endpoint_stats = {}
+    # connection pool -> connections opened so far
+    pool_connections = {}
+
+    # market moves on its own; False for recorded/canned sources, which
+    # MarketFeed waits on instead of dropping ticks
+    LIVE = True
+
+    # config/config.ini section holding the private API keys
+    CONFIG_SECTION = None
+    CONFIG_PATH = 'config/config.ini'
+
+    def __init__(self):
+        self.flight = SingleFlight()
+        # private API keys, read by the first credentials() call
+        self.CLIENT_ID = None
+        self.CLIENT_SECRET = None
+        self.USER_NAME = None
+        # currency -> StateSchema, dropped when the features change
+        self.schemas = {}
+        # currency -> OrderBook
+        self.books = {}
+        # orderbook grid levels per side appended to states, 0 disables
+        self.depth_levels = 0
+        # currency -> OrderbookFeaturizer
+        self.featurizers = {}
+        # IndicatorPipeline arguments, None disables the indicator features
+        self.indicator_config = None
+        # currency -> IndicatorPipeline
+        self.pipelines = {}
+
+    @property
+    def depth_levels(self):
+        return self._depth_levels
+
+    @depth_levels.setter
+    def depth_levels(self, depth_levels):
+        self._depth_levels = depth_levels
+        self.schemas = {}
+
+    @property
+    def indicator_config(self):
+        return self._indicator_config
+
+    @indicator_config.setter
+    def indicator_config(self, indicator_config):
+        self._indicator_config = indicator_config
+        self.schemas = {}
+
+    def credentials(self):
+        """
+        return connect_key, secret_key, username for private calls
+        public endpoints never need them, so config.ini is only read here
+        """
+        if self.CLIENT_ID is None:
+            self.load_credentials()
+        return self.CLIENT_ID, self.CLIENT_SECRET, self.USER_NAME
+
+    def load_credentials(self):
+        config = configparser.ConfigParser()
+        config.read(self.CONFIG_PATH)
+        if self.CONFIG_SECTION not in config:
+            raise Exception('No [{}] keys in {}'.format(self.CONFIG_SECTION, self.CONFIG_PATH))
+        section = config[self.CONFIG_SECTION]
+        self.CLIENT_ID = section['connect_key']
+        self.CLIENT_SECRET = section['secret_key']
+        self.USER_NAME = section['username']
+
+    def configure(self, depth_levels=0, indicator_config=None):
+        """
+        set the features get_states adds, 0/None keep the current ones
+        raise if states were already laid out with different ones, e.g. by
+        another Env sharing this instance
+        """
+        if depth_levels == 0:
+            depth_levels = self.depth_levels
+        if indicator_config is None:
+            indicator_config = self.indicator_config
+        if depth_levels == self.depth_levels and indicator_config == self.indicator_config:
+            return
+        if len(self.schemas) > 0:
+            raise Exception('Exchange in use with depth_levels {} indicators {}, '
+                    'not {} {}'.format(self.depth_levels, self.indicator_config,
+                        depth_levels, indicator_config))
+        self.depth_levels = depth_levels
+        self.indicator_config = indicator_config
+
+    def tick_size(self, currency):
+        """
+        price step of currency, None to infer it from the orderbook
+        """
+        return None
+
+    def depth_features(self, currency, last, book):
+        """
+        book: the currency's OrderBook, None before the first snapshot
+        return float32 vector of 2 * depth_levels orderbook grid features
+        """
+        featurizer = self.featurizers.get(currency)
+        if featurizer is None or featurizer.levels != self.depth_levels:
+            featurizer = OrderbookFeaturizer(self.tick_size(currency), self.depth_levels)
+            self.featurizers[currency] = featurizer
+
+        if book is None:
+            featurizer.features[:] = 0.0
+            return featurizer.features
+        return featurizer.featurize_book(book, last)
+
+    def indicator_features(self, currency, ticker, recent):
+        """
+        feed the polled trade to the currency's IndicatorPipeline
+        return its float32 features
+        """
+        pipeline = self.pipelines.get(currency)
+        if pipeline is None:
+            pipeline = IndicatorPipeline(**self.indicator_config)
+            self.pipelines[currency] = pipeline
+
+        price, units, side = self.parse_trade(recent)
+        return pipeline.update(ticker['timestamp'], price, units, side)
+
+    def state_schema(self, currency):
+        """
+        layout of the states get_states writes for currency:
+        STATE_SCHEMA, then the orderbook and indicator features when enabled
+        built once per currency, observations only look it up
+        """
+        schema = self.schemas.get(currency)
+        if schema is None:
+            schema = self.build_schema(currency)
+            self.schemas[currency] = schema
+        return schema
+
+    def build_schema(self, currency):
+        fields = []
+        if self.depth_levels > 0:
+            fields.append(("depth_bids", self.depth_levels))
+            fields.append(("depth_asks", self.depth_levels))
+        if self.indicator_config is not None:
+            fields.append(("indicators", IndicatorPipeline(**self.indicator_config).size()))
+        return self.STATE_SCHEMA.extend(fields)
+
+    def observe(self, currency, out):
+        """
+        poll, fetch the orderbook if depth_levels > 0 and featurize into out
+        return last(float), volume(float), out
+        """
+        started = time.perf_counter()
+        ticker, recent = self.poll(currency)
+        book = None
+        if self.depth_levels > 0:
+            book = self.update_book(currency, self.depth_levels)
+        fetched = time.perf_counter()
+        last, volume = self.featurize(currency, ticker, recent, book, out)
+        METRICS.observe("fetch", fetched - started)
+        METRICS.observe("featurize", time.perf_counter() - fetched)
+        return last, volume, out
+
+    def featurize(self, currency, ticker, recent, book, out):
+        """
+        write build_states, the orderbook features of book if depth_levels > 0
+        and the indicator features if indicator_config is set into out
+        return last(float), volume(float)
+        """
+        schema = self.state_schema(currency)
+        last, volume = self.build_states(ticker, recent, out)
+        if self.depth_levels > 0:
+            depth = self.depth_features(currency, last, book)
+            out[schema.slice("depth_bids")] = depth[:self.depth_levels]
+            out[schema.slice("depth_asks")] = depth[self.depth_levels:]
+        if self.indicator_config is not None:
+            out[schema.slice("indicators")] = self.indicator_features(currency, ticker, recent)
+        return last, volume
+
+    def update_book(self, currency, count=20):
+        """
+        fetch an orderbook snapshot and apply it to the currency's OrderBook
+        return the OrderBook, or None before the first successful snapshot
+        """
+        return self.apply_orderbook(currency, self.get_orderbook(currency, count))
+
+    def apply_orderbook(self, currency, orderbook):
+        """
+        apply a get_orderbook() snapshot (None if it failed) to the currency's OrderBook
+        return the OrderBook, or None before the first successful snapshot
+        """
+        book = self.books.get(currency)
+        if orderbook is None:
+            return book
+
+        if book is None:
+            book = OrderBook()
+            self.books[currency] = book
+        book.apply_snapshot(orderbook)
+        return book
+
+    @classmethod
+    def get_session(cls, url):
+        host = urlsplit(url).netloc
+        session = Exchange.sessions.get(host)
+        if session is not None:
+            return session
+
+        with Exchange.sessions_lock:
+            session = Exchange.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cls.POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["Accept-Encoding"] = "gzip, deflate"
+                Exchange.sessions[host] = session
+        return session
+
+    @classmethod
+    def close_sessions(cls):
+        """
+        drop pooled connections, new sessions use the current POOL_SIZE
+        """
+        with Exchange.sessions_lock:
+            for session in Exchange.sessions.values():
+                session.close()
+            Exchange.sessions.clear()
+
+    @classmethod
+    def connection_stats(cls):
+        """
+        return {endpoint: (requests, reused connections)}
+        """
+        return {k: tuple(v) for k, v in Exchange.endpoint_stats.items()}
+
+    def http_get(self, url):
+        """
+        GET url on the pooled keep-alive session of its host
+        return decoded JSON, or None on a connection error, timeout, non-200
+        status or malformed JSON
+        """
+        endpoint = urlsplit(url).path
+        try:
+            res = self.get_session(url).get(url, timeout=self.TIMEOUT)
+        except requests.RequestException as e:
+            # refused, reset or timed out, callers retry on None
+            logger.warning("%s: %s", endpoint, e)
+            return None
+
+        # a request that opened no connection reused a pooled one
+        # (approximate when several threads share the host pool)
+        stats = Exchange.endpoint_stats.setdefault(endpoint, [0, 0])
+        stats[0] += 1
+        pool = getattr(res.raw, "_pool", None)
+        if pool is not None:
+            opened = pool.num_connections
+            if opened == Exchange.pool_connections.get(id(pool), 0):
+                stats[1] += 1
+            Exchange.pool_connections[id(pool)] = opened
+
+        if res.status_code != 200:
+            # rate limited (429) or failing, callers retry on None
+            logger.warning("%d %s", res.status_code, endpoint)
+            return None
+
+        try:
+            return res.json()
+        except json.decoder.JSONDecodeError as e:
+            logger.warning("%s: %s", endpoint, e)
+            return None
+
     @abstractmethod
     def get_ticker(self, currency_type=None):
         pass
 
+    @abstractmethod
+    def get_all_tickers(self):
+        """
+        return tickers of every supported currency as a TICKER_DTYPE table
+        """
+        pass
+
     @abstractmethod
     def get_orderbook(self, currency_type=None, count=10):
         pass
@@ -17,9 +385,18 @@ class Exchange(ABC):
     def get_fee(self):
         pass
 
-    @abstractmethod
-    def get_states(self, currency):
-        pass
+    def get_states(self, currency, out=None):
+        """
+        write the states of currency into out (allocated if None)
+        return last(float), volume(float), out
+        """
+        if out is None:
+            out = self.state_schema(currency).allocate()
+        # concurrent callers for the same currency share one observation
+        last, volume, states = self.flight.do(currency, self.observe, currency, out)
+        if states is not out:
+            np.copyto(out, states)
+        return last, volume, out
 
     @abstractmethod
     def reset(self):
@@ -0,0 +1,40 @@
+import json
+import threading
+from bithumb import BithumbExchange
+from korbit import KorbitExchange
+from replay import ReplayExchange
+
+
+EXCHANGES = { "Bithumb": BithumbExchange, "Korbit": KorbitExchange, "Replay": ReplayExchange }
+
+exchanges = {}
+exchanges_lock = threading.Lock()
+
+
+def register_exchange(name, cls):
+    EXCHANGES[name] = cls
+
+
+def create_exchange(name, depth_levels=0, indicators=None, cached=True, **kwargs):
+    """
+    exchange for name, kwargs go to its constructor (e.g. capture, speed for Replay)
+    depth_levels, indicators: the exchange's orderbook and indicator features
+
+    Construction does no network or config access. The same name and
+    arguments return the same instance, so its single-flight get_states,
+    sessions and books are shared, unless cached=False.
+    """
+    if name not in EXCHANGES:
+        raise Exception('Not support exchange: {}'.format(name))
+
+    key = (name, depth_levels, json.dumps(indicators, sort_keys=True),
+            tuple(sorted(kwargs.items())))
+    with exchanges_lock:
+        exchange = exchanges.get(key) if cached else None
+        if exchange is None:
+            exchange = EXCHANGES[name](**kwargs)
+            exchange.depth_levels = depth_levels
+            exchange.indicator_config = indicators
+            if cached:
+                exchanges[key] = exchange
+    return exchange
@@ -0,0 +1,163 @@
+import time
+import logging
+import threading
+from collections import deque
+import numpy as np
+from async_exchange import AsyncExchange
+
+logger = logging.getLogger("m2bitcoin.feed")
+
+
+class MarketFeed():
+    """
+    One background poller per (exchange, currency).
+
+    The poller calls exchange.get_states once per tick (through an
+    AsyncExchange for a live exchange) and hands the result to every
+    subscription, so adding workers adds no API requests. Each tick gets a
+    fresh states array which subscribers only read.
+
+    A live exchange is polled at most once per POLL_INTERVAL, not at all
+    while every subscriber's backlog is full, and a subscriber that still
+    falls behind drops old ticks. A recorded or canned source (exchange.LIVE False) is
+    never skipped: the poller waits until every subscriber has room, so
+    each one sees every tick. The poller stops with the last unsubscribe
+    and the next subscribe starts it again.
+    """
+    feeds = {}
+    feeds_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, exchange, currency):
+        key = (id(exchange), currency)
+        with cls.feeds_lock:
+            feed = cls.feeds.get(key)
+            if feed is None:
+                feed = MarketFeed(exchange, currency)
+                cls.feeds[key] = feed
+        return feed
+
+    def __init__(self, exchange, currency):
+        self.exchange = exchange
+        self.currency = currency
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.thread = None
+        # wait for subscribers instead of dropping ticks
+        self.blocking = not exchange.LIVE
+        # a live exchange's requests of one tick go out together
+        self.client = AsyncExchange(exchange) if exchange.LIVE else None
+        # notified when a subscriber takes a tick or leaves
+        self.room = threading.Condition()
+
+    def subscribe(self, backlog=8):
+        subscription = FeedSubscription(self, backlog)
+        with self.lock:
+            self.subscribers = self.subscribers + [subscription]
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if s is not subscription]
+        self.taken()
+
+    def taken(self):
+        with self.room:
+            self.room.notify()
+
+    def wait_for_room(self):
+        """
+        wait until a subscriber can take a tick, or none is left
+        """
+        with self.room:
+            while True:
+                subscribers = self.subscribers
+                if len(subscribers) == 0 or not all(s.full() for s in subscribers):
+                    return
+                self.room.wait()
+
+    def run(self):
+        polled = 0.0
+        while True:
+            with self.lock:
+                if len(self.subscribers) == 0:
+                    self.thread = None
+                    return
+                # subscribers list is replaced, never mutated
+                subscribers = self.subscribers
+
+            try:
+                if self.client is not None:
+                    # no fetching ticks that would only be dropped, and
+                    # no faster than the exchange's polling interval
+                    self.wait_for_room()
+                    delay = self.exchange.POLL_INTERVAL - (time.perf_counter() - polled)
+                    if delay > 0:
+                        time.sleep(delay)
+                    polled = time.perf_counter()
+                    tick = self.client.run_states(self.currency)
+                else:
+                    tick = self.exchange.get_states(self.currency)
+            except Exception as e:
+                logger.warning("feed %s: %s", self.currency, e)
+                time.sleep(1)
+                continue
+
+            for subscription in subscribers:
+                subscription.put(tick, self.blocking)
+
+
+class FeedSubscription():
+    """
+    Per worker view of a MarketFeed, used by Env in place of the exchange.
+    Keeps the newest backlog ticks, a worker that falls behind drops the
+    oldest unless the feed is blocking.
+    """
+    def __init__(self, feed, backlog):
+        self.feed = feed
+        self.backlog = backlog
+        self.ticks = deque(maxlen=backlog)
+        self.cond = threading.Condition()
+        self.closed = False
+
+    def put(self, tick, block=False):
+        """
+        block: wait while backlog ticks are queued instead of dropping the oldest
+        """
+        with self.cond:
+            while block and len(self.ticks) >= self.backlog and not self.closed:
+                self.cond.wait()
+            if self.closed:
+                return
+            self.ticks.append(tick)
+            self.cond.notify_all()
+
+    def get_states(self, currency, out=None):
+        with self.cond:
+            while len(self.ticks) == 0:
+                self.cond.wait()
+            last, volume, states = self.ticks.popleft()
+            # room for a blocked poller
+            self.cond.notify_all()
+        self.feed.taken()
+        # every worker copies the shared tick into its own buffer
+        if out is None:
+            out = states.copy()
+        else:
+            np.copyto(out, states)
+        return last, volume, out
+
+    def full(self):
+        return len(self.ticks) >= self.backlog
+
+    def reset(self):
+        pass
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.feed.unsubscribe(self)
@@ -0,0 +1,141 @@
+import math
+import numpy as np
+
+
+def ema_alpha(window):
+    return 2.0 / (window + 1.0)
+
+
+class IndicatorPipeline():
+    """
+    Streaming indicators of one currency, O(1) time and memory per tick.
+
+    features (float32), in order:
+        price / EMA(w) - 1 for each w in ema_windows
+        price / VWAP - 1, VWAP exponentially weighted over vwap_window trades
+        volatility: exponentially weighted std of log returns
+        trade-flow imbalance: EW(side * units) / EW(units), in [-1, 1]
+        return z-score: (log return - EW mean) / EW std
+    """
+    def __init__(self, ema_windows=(12, 26, 60), vwap_window=60,
+            volatility_window=30, flow_window=30):
+        self.ema_windows = tuple(ema_windows)
+        self.ema_alphas = np.array([ema_alpha(w) for w in self.ema_windows])
+        self.vwap_alpha = ema_alpha(vwap_window)
+        self.volatility_alpha = ema_alpha(volatility_window)
+        self.flow_alpha = ema_alpha(flow_window)
+
+        self.features = np.zeros(self.size(), dtype=np.float32)
+        self.reset()
+
+    def size(self):
+        return len(self.ema_windows) + 4
+
+    def reset(self):
+        self.count = 0
+        self.prev_key = None
+        self.prev_price = 0.0
+        self.emas = np.zeros(len(self.ema_windows))
+        self.vwap_value = 0.0
+        self.vwap_units = 0.0
+        self.return_mean = 0.0
+        self.return_var = 0.0
+        self.flow_signed = 0.0
+        self.flow_units = 0.0
+        self.features[:] = 0.0
+
+    def state_dict(self):
+        """
+        running state to resume from with load_state_dict
+        """
+        state = {}
+        state['ema_windows'] = self.ema_windows
+        state['count'] = self.count
+        state['prev_key'] = self.prev_key
+        state['prev_price'] = self.prev_price
+        state['emas'] = self.emas.copy()
+        state['vwap_value'] = self.vwap_value
+        state['vwap_units'] = self.vwap_units
+        state['return_mean'] = self.return_mean
+        state['return_var'] = self.return_var
+        state['flow_signed'] = self.flow_signed
+        state['flow_units'] = self.flow_units
+        state['features'] = self.features.copy()
+        return state
+
+    def load_state_dict(self, state):
+        if tuple(state['ema_windows']) != self.ema_windows:
+            raise Exception('Indicator state for other ema_windows')
+        self.count = state['count']
+        self.prev_key = state['prev_key']
+        self.prev_price = state['prev_price']
+        self.emas[:] = state['emas']
+        self.vwap_value = state['vwap_value']
+        self.vwap_units = state['vwap_units']
+        self.return_mean = state['return_mean']
+        self.return_var = state['return_var']
+        self.flow_signed = state['flow_signed']
+        self.flow_units = state['flow_units']
+        self.features[:] = state['features']
+
+    def update(self, key, price, units, side):
+        """
+        key: identifies the tick (e.g. ticker timestamp), side: 1 buy, -1 sell
+        an unchanged (key, price, units, side) returns the cached features
+        """
+        tick_key = (key, price, units, side)
+        if tick_key == self.prev_key:
+            return self.features
+        self.prev_key = tick_key
+
+        if self.count == 0:
+            self.emas[:] = price
+            self.vwap_value = price * units
+            self.vwap_units = units
+            self.flow_signed = side * units
+            self.flow_units = units
+            self.prev_price = price
+            self.count = 1
+            self.make_features(price, 0.0)
+            return self.features
+
+        # EMAs
+        self.emas += self.ema_alphas * (price - self.emas)
+
+        # VWAP
+        a = self.vwap_alpha
+        self.vwap_value += a * (price * units - self.vwap_value)
+        self.vwap_units += a * (units - self.vwap_units)
+
+        # returns
+        r = 0.0
+        if self.prev_price > 0 and price > 0:
+            r = math.log(price / self.prev_price)
+        a = self.volatility_alpha
+        diff = r - self.return_mean
+        self.return_mean += a * diff
+        self.return_var = (1 - a) * (self.return_var + a * diff * diff)
+
+        # trade flow
+        a = self.flow_alpha
+        self.flow_signed += a * (side * units - self.flow_signed)
+        self.flow_units += a * (units - self.flow_units)
+
+        self.prev_price = price
+        self.count = self.count + 1
+        self.make_features(price, r)
+        return self.features
+
+    def make_features(self, price, r):
+        f = self.features
+        n = len(self.ema_windows)
+        for i in range(n):
+            f[i] = price / self.emas[i] - 1 if self.emas[i] > 0 else 0.0
+
+        vwap = self.vwap_value / self.vwap_units if self.vwap_units > 0 else price
+        f[n] = price / vwap - 1 if vwap > 0 else 0.0
+
+        std = math.sqrt(self.return_var)
+        f[n + 1] = std
+        f[n + 2] = self.flow_signed / self.flow_units if self.flow_units > 0 else 0.0
+        f[n + 3] = (r - self.return_mean) / std if std > 0 else 0.0
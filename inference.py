@@ -0,0 +1,101 @@
+import time
+import queue
+import threading
+import numpy as np
+from schema import STATE_DTYPE
+
+
+class InferenceServer(threading.Thread):
+    """
+    Runs one batched model.predict for the observations of many agents.
+
+    An agent's request waits at most max_wait seconds after the first
+    request of a batch, a batch is cut at max_batch_size requests. model may
+    have several outputs, every client gets its row of each.
+    """
+    def __init__(self, model, input_shape, max_batch_size=8, max_wait=0.002):
+        threading.Thread.__init__(self, daemon=True)
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.batch = np.zeros((max_batch_size,) + tuple(input_shape), dtype=STATE_DTYPE)
+        self.stopped = False
+
+        # batches run and requests served, for the average batch size
+        self.batches = 0
+        self.served = 0
+
+    def client(self):
+        return InferenceClient(self, self.batch.shape[1:])
+
+    def stop(self):
+        self.stopped = True
+        self.requests.put(None)
+
+    def collect(self):
+        first = self.requests.get()
+        if first is None:
+            return []
+        clients = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(clients) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                client = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if client is None:
+                break
+            clients.append(client)
+        return clients
+
+    def run(self):
+        while not self.stopped:
+            clients = self.collect()
+            if len(clients) == 0:
+                continue
+
+            n = len(clients)
+            for i, client in enumerate(clients):
+                self.batch[i] = client.state
+            outputs = self.model.predict(self.batch[:n])
+            if not isinstance(outputs, list):
+                outputs = [outputs]
+
+            for i, client in enumerate(clients):
+                client.outputs = [output[i] for output in outputs]
+                client.ready.set()
+
+            self.batches += 1
+            self.served += n
+
+    def average_batch_size(self):
+        if self.batches == 0:
+            return 0.0
+        return self.served / float(self.batches)
+
+
+class InferenceClient():
+    """
+    One agent's handle on an InferenceServer, reused for every request.
+    """
+    def __init__(self, server, input_shape):
+        self.server = server
+        self.state = np.zeros(input_shape, dtype=STATE_DTYPE)
+        self.ready = threading.Event()
+        self.outputs = None
+
+    def predict(self, state):
+        """
+        return the model outputs for one state, a list if the model has several
+        """
+        np.copyto(self.state, state.reshape(self.state.shape))
+        self.ready.clear()
+        self.server.requests.put(self)
+        self.ready.wait()
+        if len(self.outputs) == 1:
+            return self.outputs[0]
+        return self.outputs
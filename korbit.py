@@ -1,9 +1,8 @@
-import requests
 import time
 import math
-from exchange import Exchange
-import configparser
-import json
+from exchange import Exchange, make_ticker_table
+from concurrent.futures import ThreadPoolExecutor
+from schema import StateSchema
 import base64
 import hashlib
 import hmac
@@ -21,15 +20,23 @@ class KorbitExchange(Exchange):
             "ETC": "etc_krw", "XRP": "xrp_krw", "BCH": "bch_krw", "BTG":
             "btg_krw" }
 
-    QUERY_RUNNING = False
+    # transactions kept in the states
+    RECENT_STATES = 21
+    # states written by build_states
+    STATE_SCHEMA = StateSchema([("recents", 2 * RECENT_STATES)])
+
+    CONFIG_SECTION = "KORBIT"
+    FEE_PERCENT = 0.08
+    # seconds between retries of a failed request
+    POLL_INTERVAL = 1
+    # recent transactions used by build_states
+    RECENT_COUNT = 10
 
     def __init__(self):
-        config = configparser.ConfigParser()
-        config.read('config/config.ini')
-        self.CLIENT_ID = config['KORBIT']['connect_key']
-        self.CLIENT_SECRET = config['KORBIT']['secret_key']
-        self.USER_NAME = config['KORBIT']['username']
+        super().__init__()
         self.data_count = 10
+        self.tickers = {}
+        self.executor = None
 
     def get_ticker(self, currency_type=None):
         if currency_type is None:
@@ -41,25 +48,34 @@ class KorbitExchange(Exchange):
         ticker_api_path = \
                 "/ticker/detailed?currency_pair={currency}".format(currency=my_currency)
         url_path = self.BASE_API_URL + ticker_api_path
-        res = requests.get(url_path)
-
-        response_json = None
-        try:
-            response_json = res.json()
-        except json.decoder.JSONDecodeError as e:
-            print(e)
+        response_json = self.http_get(url_path)
+        if response_json is None:
             return None
-        else:
-            result={}
-            result["timestamp"] = str(response_json['timestamp'])
-            result["last"] = response_json['last']
-            result["bid"] = response_json['bid']
-            result["ask"] = response_json['ask']
-            result["low"] = response_json['low']
-            result["high"] = response_json['high']
-            result["volume"] = response_json['volume']
-
-            return result
+
+        result={}
+        result["timestamp"] = str(response_json['timestamp'])
+        result["last"] = response_json['last']
+        result["bid"] = response_json['bid']
+        result["ask"] = response_json['ask']
+        result["low"] = response_json['low']
+        result["high"] = response_json['high']
+        result["volume"] = response_json['volume']
+
+        return result
+
+    def get_all_tickers(self):
+        # korbit has no all-pairs ticker, fetch the pairs concurrently
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=len(self.CURRENCY_MAP))
+
+        currencies = list(self.CURRENCY_MAP.keys())
+        results = self.executor.map(self.get_ticker, currencies)
+
+        tickers = []
+        for currency, ticker in zip(currencies, results):
+            if ticker is not None:
+                tickers.append((currency, ticker))
+        return make_ticker_table(tickers)
 
     def get_orderbook(self, currency_type=None, count=10):
         if currency_type is None:
@@ -71,19 +87,15 @@ class KorbitExchange(Exchange):
         orderbook_api_path = \
                 "/orderbook?currency_pair={currency}".format(currency=my_currency)
         url_path = self.BASE_API_URL + orderbook_api_path
-        res = requests.get(url_path)
-        response_json = None
-        try:
-            response_json = res.json()
-        except json.decoder.JSONDecodeError as e:
-            print(e)
+        response_json = self.http_get(url_path)
+        if response_json is None:
             return None
-        else:
-            result={}
-            result["timestamp"] = str(response_json['timestamp'])
-            result["bids"] = response_json['bids']
-            result["asks"] = response_json['asks']
-            return result
+
+        result={}
+        result["timestamp"] = str(response_json['timestamp'])
+        result["bids"] = response_json['bids']
+        result["asks"] = response_json['asks']
+        return result
 
     def get_recent(self, currency_type=None, count=10):
         if currency_type is None:
@@ -95,40 +107,71 @@ class KorbitExchange(Exchange):
         recent_api_path = \
                 "/transactions?currency_pair={currency}".format(currency=my_currency)
         url_path = self.BASE_API_URL + recent_api_path 
-        res = requests.get(url_path)
-        response_json = None
-        try:
-            response_json = res.json()
-        except json.decoder.JSONDecodeError as e:
-            print(e)
+        response_json = self.http_get(url_path)
+        if response_json is None:
             return None
-        else:
-            result = response_json
-            return result
+
+        result = response_json
+        return result
 
     def get_fee(self):
-        return 0.08
+        return self.FEE_PERCENT
 
-    def get_states(self, currency):
-        while self.QUERY_RUNNING is True:
-            # print("QUERY RUNNING...")
-            time.sleep(1)
+    def reset(self):
+        pass
 
-        # print("QUERY_RUNNING unlocked")
-        self.QUERY_RUNNING = True
+    def keep_ticker(self, currency, ticker):
+        self.tickers[currency] = ticker
 
+    def match_recent(self, currency, recents):
+        """
+        return (ticker, recents) once a ticker was kept for currency, otherwise None
+        """
+        ticker = self.tickers.get(currency)
+        if ticker is None:
+            return None
+        return ticker, recents
+
+    def poll_once(self, currency):
+        """
+        one ticker and recents fetch, no waiting
+        return (ticker, recents), or None if a request failed
+        """
+        ticker = self.get_ticker(currency)
+        if ticker is None:
+            return None
+        self.keep_ticker(currency, ticker)
+
+        recents = self.get_recent(currency, self.RECENT_COUNT)
+        if recents is None:
+            return None
+        return self.match_recent(currency, recents)
+
+    def poll(self, currency):
+        """
+        return (ticker, recents) fetched for one observation
+        """
         ticker = self.get_ticker(currency)
         while ticker is None:
-            time.sleep(1)
+            time.sleep(self.POLL_INTERVAL)
             ticker = self.get_ticker(currency)
+        self.keep_ticker(currency, ticker)
 
         # orderbook = self.get_orderbook(currency)
-        recents = self.get_recent(currency)
+        recents = self.get_recent(currency, self.RECENT_COUNT)
         while recents is None:
-            time.sleep(1)
-            recents = self.get_recent(currency)
+            time.sleep(self.POLL_INTERVAL)
+            recents = self.get_recent(currency, self.RECENT_COUNT)
+
+        return self.match_recent(currency, recents)
 
-        states = []
+    @staticmethod
+    def build_states(ticker, recents, out):
+        """
+        write states made from ticker, recents into out[:STATE_SCHEMA.size]
+        return last(float), volume(float)
+        """
+        states = out[KorbitExchange.STATE_SCHEMA.slice('recents')]
         last = float(ticker['last'])
         volume = float(ticker['volume'])
 
@@ -173,21 +216,28 @@ class KorbitExchange(Exchange):
         #     states.append(q)
 
         ## recent
+        # (price / last, amount) of the newest RECENT_STATES transactions, zero padded
         i = 0
-        for recent in recents:
+        for recent in recents[:KorbitExchange.RECENT_STATES]:
             u = float(recent['amount'])
             p = float(recent['price'])
             p = p / last
             # p = p * u
-            states.append(p)
-            states.append(u)
-            i = i + 1
-            if i > 20:
-                break
+            states[i] = p
+            states[i + 1] = u
+            i = i + 2
+        states[i:] = 0.0
 
-        self.QUERY_RUNNING = False
+        return last, volume
 
-        return last, volume ,states
+    @staticmethod
+    def parse_trade(recents):
+        """
+        return price(float), units(float), side(1: buy, -1: sell) of the newest polled transaction
+        """
+        recent = recents[0]
+        side = 1 if recent.get('type') == 'buy' else -1
+        return float(recent['price']), float(recent['amount']), side
 
 
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+import sys, getopt
+import time
+import logging
+import numpy as np
+
+from environment import Env
+from metrics import METRICS, setup_logging
+from numpy_model import NumpyA3CModel
+
+logger = logging.getLogger("m2bitcoin.live")
+
+
+class LiveRunner():
+    """
+    Trades env with an exported policy in NumPy, no keras/tensorflow in the
+    process. Each decision is one policy_value() on preallocated buffers.
+
+    greedy: take the most probable action instead of sampling the policy
+    interval: seconds between decisions
+    """
+    def __init__(self, env, model, greedy=True, interval=0.0):
+        if (model.history_size, model.state_size) != (env.history_size(), env.state_size()):
+            raise Exception('Model expects history {} state {}, env has history {} state {}'.format(
+                model.history_size, model.state_size, env.history_size(), env.state_size()))
+        self.env = env
+        self.model = model
+        self.greedy = greedy
+        self.interval = interval
+        self.stopped = False
+
+    def decide(self, state):
+        """
+        return action, policy, value, decision latency in seconds
+        """
+        started = time.perf_counter()
+        policy, value = self.model.policy_value(state)
+        if self.greedy:
+            action = int(np.argmax(policy))
+        else:
+            action = np.random.choice(self.model.action_size, 1, p=policy)[0]
+        latency = time.perf_counter() - started
+        METRICS.observe("decide", latency)
+        return action, policy, value, latency
+
+    def run(self, steps=0):
+        """
+        steps: decisions to make, 0 runs until stop() or the env is done
+        """
+        env = self.env
+        state = env.reset()
+        step = 0
+        while not self.stopped and (steps == 0 or step < steps):
+            action, policy, value, latency = self.decide(state)
+            state, reward, done, info = env.step(action)
+            step += 1
+            # per step at DEBUG, -n samples it
+            logger.debug("step: %d action: %s value: %.4f decide: %.1fus earning_rate: %.4f",
+                    step, info['last_action'], value, latency * 1e6, info['earning_rate'])
+            if done:
+                logger.info("done, earning_rate: %.4f", info['earning_rate'])
+                break
+            if self.interval > 0:
+                time.sleep(self.interval)
+        return step
+
+    def stop(self):
+        self.stopped = True
+
+
+# -m m2bitcoin_a3c.npz from numpy_model.py, the same Env options as training
+# -r samples the policy instead of taking its most probable action
+# -t seconds between decisions, -x decisions to make (0 until done)
+if __name__ == "__main__":
+    myopts, args = getopt.getopt(sys.argv[1:], "m:c:e:f:s:d:ik:l:n:rt:x:")
+    path = "m2bitcoin_a3c.npz"
+    exchange = 'Bithumb'
+    currency = 'BTC'
+    capture = None
+    speed = 0.0
+    depth_levels = 0
+    indicators = None
+    history = 1
+    log_level = 'INFO'
+    sample_every = 1
+    greedy = True
+    interval = 0.0
+    steps = 0
+
+    for o, a in myopts:
+        if o == '-m':
+            path = a
+        elif o == '-e':
+            exchange = a
+        elif o == '-c':
+            currency = a
+        elif o == '-f':
+            capture = a
+        elif o == '-s':
+            speed = float(a)
+        elif o == '-d':
+            depth_levels = int(a)
+        elif o == '-i':
+            indicators = {}
+        elif o == '-k':
+            history = int(a)
+        elif o == '-l':
+            log_level = a.upper()
+        elif o == '-n':
+            sample_every = int(a)
+        elif o == '-r':
+            greedy = False
+        elif o == '-t':
+            interval = float(a)
+        elif o == '-x':
+            steps = int(a)
+        else:
+            print("Usage: %s -m model.npz -e exchange -c currency [-f capture -s speed] [-d depth_levels] [-i] [-k history] [-l level -n sample_every] [-r] [-t interval] [-x steps]" % sys.argv[0])
+
+    setup_logging(getattr(logging, log_level), sample_every)
+
+    env = Env(5000*10000, exchange=exchange, currency=currency, percent_per_trade=0.01,
+            capture=capture, speed=speed, depth_levels=depth_levels,
+            indicators=indicators, history=history)
+    runner = LiveRunner(env, NumpyA3CModel(path), greedy=greedy, interval=interval)
+    try:
+        runner.run(steps)
+    except KeyboardInterrupt:
+        runner.stop()
@@ -0,0 +1,179 @@
+import os
+import queue
+import logging
+import threading
+import numpy as np
+
+
+# latency bucket upper bounds in seconds, 10us .. ~10s
+LATENCY_BUCKETS = np.logspace(-5, 1, 25)
+
+PHASES = ["fetch", "featurize", "inference", "env", "train", "sync"]
+
+
+class Histogram():
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # last slot counts values above the last bucket
+        self.counts = np.zeros(len(buckets) + 1, dtype=np.int64)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[np.searchsorted(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, q):
+        """
+        upper bound of the bucket holding the q-th percentile (0 < q <= 100)
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q / 100.0 * self.count
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        if index >= len(self.buckets):
+            return float('inf')
+        return float(self.buckets[index])
+
+
+class Metrics():
+    """
+    Cheap to call from agent threads: observations are only queued here,
+    MetricsWriter aggregates and writes them in the background.
+    Nothing is queued until a writer is started, so the queue never grows
+    without someone draining it.
+    """
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.enabled = False
+
+    def observe(self, phase, seconds):
+        if self.enabled:
+            self.queue.put(("latency", phase, seconds, None))
+
+    def summary(self, tag, value, step):
+        if self.enabled:
+            self.queue.put(("summary", tag, float(value), step))
+
+    def drain(self, limit=100000):
+        events = []
+        try:
+            while len(events) < limit:
+                events.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+
+# process wide metrics, like the episode counter
+METRICS = Metrics()
+
+
+class MetricsWriter(threading.Thread):
+    """
+    Drains Metrics every interval seconds, keeps per-phase latency histograms,
+    writes the summaries to TensorBoard in one batch and the histograms to a
+    Prometheus-style text file.
+    """
+    def __init__(self, metrics=METRICS, summary_writer=None, path=None, interval=5.0):
+        threading.Thread.__init__(self, daemon=True)
+        self.metrics = metrics
+        self.summary_writer = summary_writer
+        self.path = path
+        self.interval = interval
+        self.histograms = {}
+        self.last_summaries = {}
+        self.stopped = threading.Event()
+
+    def histogram(self, phase):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = Histogram()
+            self.histograms[phase] = histogram
+        return histogram
+
+    def start(self):
+        self.metrics.enabled = True
+        threading.Thread.start(self)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def stop(self):
+        self.stopped.set()
+        self.metrics.enabled = False
+
+    def flush(self):
+        summaries = {}
+        for kind, name, value, step in self.metrics.drain():
+            if kind == "latency":
+                self.histogram(name).observe(value)
+            else:
+                summaries.setdefault(step, []).append((name, value))
+                self.last_summaries[name] = value
+
+        if self.summary_writer is not None and len(summaries) > 0:
+            self.write_summaries(summaries)
+        if self.path is not None:
+            self.write_exposition()
+
+    def write_summaries(self, summaries):
+        import tensorflow as tf
+        for step, values in summaries.items():
+            summary = tf.Summary(value=[tf.Summary.Value(tag=tag, simple_value=value)
+                for tag, value in values])
+            self.summary_writer.add_summary(summary, step)
+        self.summary_writer.flush()
+
+    def exposition(self):
+        lines = []
+        lines.append("# TYPE m2bitcoin_phase_seconds histogram")
+        for phase in sorted(self.histograms.keys()):
+            histogram = self.histograms[phase]
+            cumulative = np.cumsum(histogram.counts)
+            for bound, count in zip(histogram.buckets, cumulative):
+                lines.append('m2bitcoin_phase_seconds_bucket{phase="%s",le="%g"} %d' % (phase, bound, count))
+            lines.append('m2bitcoin_phase_seconds_bucket{phase="%s",le="+Inf"} %d' % (phase, histogram.count))
+            lines.append('m2bitcoin_phase_seconds_sum{phase="%s"} %.9f' % (phase, histogram.sum))
+            lines.append('m2bitcoin_phase_seconds_count{phase="%s"} %d' % (phase, histogram.count))
+
+        lines.append("# TYPE m2bitcoin_summary gauge")
+        for tag in sorted(self.last_summaries.keys()):
+            lines.append('m2bitcoin_summary{tag="%s"} %g' % (tag, self.last_summaries[tag]))
+        return "\n".join(lines) + "\n"
+
+    def write_exposition(self):
+        with open(self.path + ".tmp", "w") as f:
+            f.write(self.exposition())
+        os.replace(self.path + ".tmp", self.path)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Passes every record at or above min_level, and one in `every` below it.
+    """
+    def __init__(self, every, min_level=logging.INFO):
+        logging.Filter.__init__(self)
+        self.every = every
+        self.min_level = min_level
+        self.seen = 0
+
+    def filter(self, record):
+        if record.levelno >= self.min_level:
+            return True
+        self.seen += 1
+        return self.seen % self.every == 0
+
+
+def setup_logging(level=logging.INFO, sample_every=1):
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    if sample_every > 1:
+        handler.addFilter(SampleFilter(sample_every))
+    logger = logging.getLogger("m2bitcoin")
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    return logger
@@ -0,0 +1,251 @@
+import sys, getopt
+import json
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from replay import ReplayExchange
+from synthetic import SyntheticMarket
+
+
+class RecordedMarket():
+    """
+    SyntheticMarket stand-in serving the frames of a ReplayExchange capture.
+    A ticker request moves the currency to its next frame, so a client's
+    ticker then transactions requests get a matching pair like on the live
+    exchange.
+    """
+    def __init__(self, capture_path):
+        self.replay = ReplayExchange(capture_path, loop=True)
+        self.source = self.replay.source
+        self.lock = threading.Lock()
+
+    def response(self, exchange, path, query=""):
+        if exchange != self.source:
+            return None
+        if exchange == "Korbit" and path.startswith("/v1/"):
+            path = path[3:]
+
+        with self.lock:
+            if exchange == "Bithumb":
+                parts = path.strip("/").split("/")
+                if len(parts) != 3 or parts[2] not in self.replay.frames:
+                    return None
+                endpoint, currency = parts[1], parts[2]
+            else:
+                pair = parse_qs(query).get("currency_pair", ["btc_krw"])[0]
+                currency = pair.split("_")[0].upper()
+                if currency not in self.replay.frames:
+                    return None
+                endpoint = path
+
+            if endpoint in ("ticker", "/ticker/detailed"):
+                self.replay.next_frame(currency)
+            frame = self.replay.current_frame(currency)
+
+            if exchange == "Bithumb":
+                return self.bithumb_response(endpoint, frame)
+            return self.korbit_response(endpoint, frame)
+
+    @staticmethod
+    def bithumb_response(endpoint, frame):
+        # frames hold what BithumbExchange parsed, undo parse_ticker
+        if endpoint == "ticker":
+            ticker = frame['ticker']
+            return {"status": "0000", "data": {
+                "opening_price": ticker['start'], "closing_price": ticker['last'],
+                "min_price": ticker['low'], "max_price": ticker['high'],
+                "average_price": ticker['average'], "units_traded": ticker['volume'],
+                "volume_1day": ticker['volume'], "volume_7day": ticker['volume7'],
+                "buy_price": ticker['bid'], "sell_price": ticker['ask'],
+                "date": ticker['timestamp']}}
+        elif endpoint == "recent_transactions":
+            return {"status": "0000", "data": [frame['recent']]}
+        elif endpoint == "orderbook" and frame.get('orderbook') is not None:
+            return {"status": "0000", "data": frame['orderbook']}
+        return None
+
+    @staticmethod
+    def korbit_response(endpoint, frame):
+        if endpoint == "/ticker/detailed":
+            return frame['ticker']
+        elif endpoint == "/transactions":
+            return frame['recent']
+        elif endpoint == "/orderbook" and frame.get('orderbook') is not None:
+            return frame['orderbook']
+        return None
+
+
+class MockExchangeHandler(BaseHTTPRequestHandler):
+    # keep-alive, the exchanges use pooled sessions
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        status, body, headers = self.server.respond(self.path, self.client_address[0])
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockExchangeServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Bithumb (/public/...) and Korbit (/v1/...) public
+    APIs. Point an exchange at it with
+        bithumb.BASE_API_URL = server.url
+        korbit.BASE_API_URL = server.url + "/v1"
+
+    market: SyntheticMarket (default) or RecordedMarket
+    latency, jitter: seconds added to every response, jitter uniform +-
+    error_rate: fraction of requests answered with 500
+    malformed_rate: fraction of answers with truncated JSON
+    rate_limit: requests per second per client address, more get 429 (0 no limit)
+    """
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), market=None, latency=0.0, jitter=0.0,
+            error_rate=0.0, malformed_rate=0.0, rate_limit=0, seed=None):
+        ThreadingHTTPServer.__init__(self, address, MockExchangeHandler)
+        self.market = market if market is not None else SyntheticMarket(seed=seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.rate_limit = rate_limit
+        self.random = np.random.RandomState(seed)
+        self.lock = threading.Lock()
+        # per client address, times of the requests in the last second
+        self.windows = {}
+        self.stats = { "ok": 0, "not_found": 0, "error": 0, "malformed": 0, "rate_limited": 0 }
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def limited(self, client):
+        if self.rate_limit <= 0:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.setdefault(client, deque())
+            while len(window) > 0 and window[0] <= now - 1.0:
+                window.popleft()
+            if len(window) >= self.rate_limit:
+                return True
+            window.append(now)
+        return False
+
+    def respond(self, target, client):
+        """
+        return status, body(bytes), extra headers for a GET of target
+        """
+        if self.limited(client):
+            self.count("rate_limited")
+            body = {"status": "5600", "message": "Too Many Requests"}
+            return 429, json.dumps(body).encode(), [("Retry-After", "1")]
+
+        with self.lock:
+            delay = self.latency
+            if self.jitter > 0:
+                delay += self.random.uniform(-self.jitter, self.jitter)
+            fail = self.random.rand() < self.error_rate
+            malformed = self.random.rand() < self.malformed_rate
+        if delay > 0:
+            time.sleep(delay)
+
+        if fail:
+            self.count("error")
+            return 500, b"<html><body>500 Internal Server Error</body></html>", []
+
+        parts = urlsplit(target)
+        exchange = "Bithumb" if parts.path.startswith("/public/") else "Korbit"
+        payload = self.market.response(exchange, parts.path, parts.query)
+        if payload is None:
+            self.count("not_found")
+            return 404, json.dumps({"status": "5100", "message": "Bad Request"}).encode(), []
+
+        body = json.dumps(payload).encode()
+        if malformed:
+            self.count("malformed")
+            return 200, body[:len(body) // 2], []
+
+        self.count("ok")
+        return 200, body, []
+
+
+# -p 8080
+# -c BTC,ETH (synthetic currencies) or -f capture.jsonl (recorded frames)
+# -l 50 -j 20 (latency and jitter in ms)
+# -e 0.01 (error rate) -m 0.01 (malformed JSON rate)
+# -r 20 (requests per second per client)
+# -s 0 (seed)
+if __name__ == "__main__":
+    myopts, args = getopt.getopt(sys.argv[1:], "p:c:f:l:j:e:m:r:s:")
+    port = 8080
+    currencies = ['BTC', 'ETH']
+    capture = None
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    malformed_rate = 0.0
+    rate_limit = 0
+    seed = None
+
+    for o, a in myopts:
+        if o == '-p':
+            port = int(a)
+        elif o == '-c':
+            currencies = a.split(',')
+        elif o == '-f':
+            capture = a
+        elif o == '-l':
+            latency = float(a) / 1000
+        elif o == '-j':
+            jitter = float(a) / 1000
+        elif o == '-e':
+            error_rate = float(a)
+        elif o == '-m':
+            malformed_rate = float(a)
+        elif o == '-r':
+            rate_limit = int(a)
+        elif o == '-s':
+            seed = int(a)
+        else:
+            print("Usage: %s [-p port] [-c currencies | -f capture] [-l latency_ms -j jitter_ms] [-e error_rate] [-m malformed_rate] [-r rate_limit] [-s seed]" % sys.argv[0])
+
+    if capture is not None:
+        market = RecordedMarket(capture)
+    else:
+        market = SyntheticMarket(currencies=currencies, seed=seed)
+
+    server = MockExchangeServer(("127.0.0.1", port), market, latency, jitter,
+            error_rate, malformed_rate, rate_limit, seed)
+    print("serving on", server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats)
+        server.server_close()
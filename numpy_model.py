@@ -0,0 +1,207 @@
+import sys, getopt
+import numpy as np
+import checkpoint
+
+
+def linear(x, out):
+    np.copyto(out, x)
+    return out
+
+
+def tanh(x, out):
+    return np.tanh(x, out=out)
+
+
+def sigmoid(x, out):
+    np.negative(x, out=out)
+    np.exp(out, out=out)
+    out += 1.0
+    return np.reciprocal(out, out=out)
+
+
+def hard_sigmoid(x, out):
+    # keras 2: clip(0.2 * x + 0.5, 0, 1)
+    np.multiply(x, 0.2, out=out)
+    out += 0.5
+    return np.clip(out, 0.0, 1.0, out=out)
+
+
+def relu(x, out):
+    return np.maximum(x, 0.0, out=out)
+
+
+ACTIVATIONS = { "linear": linear, "tanh": tanh, "sigmoid": sigmoid,
+        "hard_sigmoid": hard_sigmoid, "relu": relu }
+
+
+def save_weights(path, history_size, weights, activation="tanh", recurrent_activation="hard_sigmoid"):
+    """
+    write the fused build_model get_weights() list (LSTM kernel, recurrent
+    kernel, bias, policy Dense kernel, bias, value Dense kernel, bias) to a
+    .npz for NumpyA3CModel
+    the activation defaults are keras 2.0's LSTM defaults
+    """
+    (kernel, recurrent_kernel, bias, policy_kernel, policy_bias,
+            value_kernel, value_bias) = weights
+    np.savez(path,
+            history_size=history_size, state_size=kernel.shape[0],
+            activation=activation, recurrent_activation=recurrent_activation,
+            lstm_kernel=kernel, lstm_recurrent_kernel=recurrent_kernel, lstm_bias=bias,
+            policy_kernel=policy_kernel, policy_bias=policy_bias,
+            value_kernel=value_kernel, value_bias=value_bias)
+
+
+def export_checkpoint(checkpoint_path, path, history_size=None):
+    """
+    export the model of an A3CAgent checkpoint, no keras needed
+    history_size: for checkpoints that do not record it
+    """
+    state = checkpoint.load(checkpoint_path)
+    if history_size is None:
+        history_size = state.get('history_size')
+    if history_size is None:
+        raise Exception('Checkpoint has no history_size: {}'.format(checkpoint_path))
+    activation, recurrent_activation = state.get('activations', ("tanh", "hard_sigmoid"))
+    save_weights(path, history_size, state['weights'], activation, recurrent_activation)
+
+
+def export_model(actor, critic, path):
+    """
+    write the weights and activations of build_model's actor/critic to a .npz
+    """
+    lstm = [layer for layer in actor.layers if layer.__class__.__name__ == "LSTM"][0]
+    config = lstm.get_config()
+    weights = lstm.get_weights() + actor.layers[-1].get_weights() + critic.layers[-1].get_weights()
+    save_weights(path, actor.input_shape[1], weights,
+            config["activation"], config["recurrent_activation"])
+
+
+class NumpyA3CModel():
+    """
+    Forward pass of build_model (LSTM, softmax policy and linear value heads)
+    in NumPy, from a .npz written by save_weights.
+
+    LSTM gates follow keras: kernel columns are i, f, c, o and
+    z = x W + h U + b, c = f * c + i * act(z_c), h = o * act(c).
+    policy_value() reuses preallocated buffers for one state, predict() runs
+    a batch.
+    """
+    def __init__(self, path):
+        weights = np.load(path)
+        self.history_size = int(weights["history_size"])
+        self.state_size = int(weights["state_size"])
+        self.activation = ACTIVATIONS[str(weights["activation"])]
+        self.recurrent_activation = ACTIVATIONS[str(weights["recurrent_activation"])]
+
+        self.kernel = weights["lstm_kernel"].astype(np.float32)
+        self.recurrent_kernel = weights["lstm_recurrent_kernel"].astype(np.float32)
+        self.bias = weights["lstm_bias"].astype(np.float32)
+        self.policy_kernel = weights["policy_kernel"].astype(np.float32)
+        self.policy_bias = weights["policy_bias"].astype(np.float32)
+        self.value_kernel = weights["value_kernel"].astype(np.float32)
+        self.value_bias = weights["value_bias"].astype(np.float32)
+        self.units = self.recurrent_kernel.shape[0]
+        self.action_size = self.policy_bias.shape[0]
+
+        self.buffers = self.allocate(1)
+
+    def allocate(self, batch):
+        u = self.units
+        buffers = {}
+        buffers["xw"] = np.zeros((batch, self.history_size, 4 * u), dtype=np.float32)
+        buffers["z"] = np.zeros((batch, 4 * u), dtype=np.float32)
+        buffers["gates"] = np.zeros((batch, 4 * u), dtype=np.float32)
+        buffers["h"] = np.zeros((batch, u), dtype=np.float32)
+        buffers["c"] = np.zeros((batch, u), dtype=np.float32)
+        buffers["tmp"] = np.zeros((batch, u), dtype=np.float32)
+        buffers["policy"] = np.zeros((batch, self.action_size), dtype=np.float32)
+        buffers["value"] = np.zeros((batch, 1), dtype=np.float32)
+        return buffers
+
+    def forward(self, x, buffers):
+        """
+        x: (batch, history_size, state_size) float32
+        fills buffers["policy"], buffers["value"]
+        """
+        u = self.units
+        xw, z, gates = buffers["xw"], buffers["z"], buffers["gates"]
+        h, c, tmp = buffers["h"], buffers["c"], buffers["tmp"]
+        act = self.activation
+        recurrent_act = self.recurrent_activation
+
+        # input projection of every timestep at once
+        np.matmul(x, self.kernel, out=xw)
+        xw += self.bias
+        h.fill(0.0)
+        c.fill(0.0)
+
+        i, f, g, o = gates[:, :u], gates[:, u:2 * u], gates[:, 2 * u:3 * u], gates[:, 3 * u:]
+        z_g = z[:, 2 * u:3 * u]
+        for t in range(self.history_size):
+            np.matmul(h, self.recurrent_kernel, out=z)
+            z += xw[:, t]
+            # all four gates in one call, then the cell input over its slice
+            recurrent_act(z, gates)
+            act(z_g, g)
+            c *= f
+            np.multiply(i, g, out=tmp)
+            c += tmp
+            act(c, tmp)
+            np.multiply(o, tmp, out=h)
+
+        policy = buffers["policy"]
+        np.matmul(h, self.policy_kernel, out=policy)
+        policy += self.policy_bias
+        policy -= policy.max(axis=1, keepdims=True)
+        np.exp(policy, out=policy)
+        policy /= policy.sum(axis=1, keepdims=True)
+
+        value = buffers["value"]
+        np.matmul(h, self.value_kernel, out=value)
+        value += self.value_bias
+
+    def policy_value(self, state):
+        """
+        return policy (valid until the next call), value(float) of one state
+        """
+        x = np.asarray(state, dtype=np.float32).reshape(1, self.history_size, self.state_size)
+        self.forward(x, self.buffers)
+        return self.buffers["policy"][0], float(self.buffers["value"][0, 0])
+
+    def predict(self, states):
+        """
+        states: (batch, history_size, state_size)
+        return policy (batch, action_size), value (batch, 1) like the fused keras model
+        """
+        x = np.asarray(states, dtype=np.float32).reshape(-1, self.history_size, self.state_size)
+        buffers = self.allocate(len(x))
+        self.forward(x, buffers)
+        return buffers["policy"], buffers["value"]
+
+
+# export the newest checkpoint of ./save_model/checkpoints for NumpyA3CModel:
+# -o m2bitcoin_a3c.npz [-f checkpoint.pkl] [-k history, if the checkpoint has none]
+if __name__ == "__main__":
+    myopts, args = getopt.getopt(sys.argv[1:], "o:f:k:")
+    output = "m2bitcoin_a3c.npz"
+    path = None
+    history = None
+
+    for o, a in myopts:
+        if o == '-o':
+            output = a
+        elif o == '-f':
+            path = a
+        elif o == '-k':
+            history = int(a)
+        else:
+            print("Usage: %s -o output.npz [-f checkpoint] [-k history]" % sys.argv[0])
+
+    if path is None:
+        path = checkpoint.latest('./save_model/checkpoints')
+    if path is None:
+        print("no checkpoint in ./save_model/checkpoints")
+        sys.exit(1)
+
+    export_checkpoint(path, output, history)
+    print("exported", path, "to", output)
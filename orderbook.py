@@ -0,0 +1,220 @@
+import numpy as np
+
+
+def levels_to_arrays(levels):
+    """
+    get_orderbook() bids/asks to (prices, quantities) float64 arrays
+    Bithumb levels are {"price": "...", "quantity": "..."},
+    Korbit levels are ["price", "quantity", "orders"]
+    """
+    n = len(levels)
+    prices = np.zeros(n)
+    quantities = np.zeros(n)
+    if n == 0:
+        return prices, quantities
+
+    if isinstance(levels[0], dict):
+        for i, level in enumerate(levels):
+            prices[i] = float(level['price'])
+            quantities[i] = float(level['quantity'])
+    else:
+        for i, level in enumerate(levels):
+            prices[i] = float(level[0])
+            quantities[i] = float(level[1])
+    return prices, quantities
+
+
+class BookSide():
+    """
+    One side of the book, best level first.
+    keys are sign * price so both sides are sorted ascending.
+    """
+    def __init__(self, sign):
+        self.sign = sign
+        self.keys = np.zeros(0)
+        self.quantities = np.zeros(0)
+        self.cumulative = np.zeros(0)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prices(self):
+        return self.sign * self.keys
+
+    def apply(self, prices, quantities):
+        """
+        diff a snapshot of this side against the book and apply only the changes
+        return number of levels added, removed or changed
+        """
+        new_keys = self.sign * prices
+        order = np.argsort(new_keys, kind='stable')
+        new_keys = new_keys[order]
+        new_quantities = quantities[order]
+
+        keys = self.keys
+        if len(keys) == len(new_keys) and np.array_equal(keys, new_keys):
+            changed = self.quantities != new_quantities
+            count = int(np.count_nonzero(changed))
+            if count > 0:
+                self.quantities[changed] = new_quantities[changed]
+                np.cumsum(self.quantities, out=self.cumulative)
+            return count
+
+        # update levels present on both sides
+        pos = np.searchsorted(keys, new_keys)
+        exists = np.zeros(len(new_keys), dtype=bool)
+        changed = exists
+        if len(keys) > 0:
+            pos = np.minimum(pos, len(keys) - 1)
+            exists = keys[pos] == new_keys
+            changed = exists & (self.quantities[pos] != new_quantities)
+            self.quantities[pos[changed]] = new_quantities[changed]
+
+        # drop levels missing from the snapshot, insert new ones
+        removed = np.ones(len(keys), dtype=bool)
+        removed[pos[exists]] = False
+        added = ~exists
+        if removed.any():
+            self.keys = keys[~removed]
+            self.quantities = self.quantities[~removed]
+        if added.any():
+            at = np.searchsorted(self.keys, new_keys[added])
+            self.keys = np.insert(self.keys, at, new_keys[added])
+            self.quantities = np.insert(self.quantities, at, new_quantities[added])
+
+        self.cumulative = np.cumsum(self.quantities)
+        return int(np.count_nonzero(changed)) + int(np.count_nonzero(removed)) + int(np.count_nonzero(added))
+
+    def best(self):
+        if len(self.keys) == 0:
+            return None
+        return self.sign * self.keys[0]
+
+    def depth(self, levels):
+        """
+        total quantity of the best levels
+        """
+        n = min(levels, len(self.cumulative))
+        if n <= 0:
+            return 0.0
+        return float(self.cumulative[n - 1])
+
+    def volume_to(self, price):
+        """
+        total quantity from the best level up to and including price
+        """
+        n = int(np.searchsorted(self.keys, self.sign * price, side='right'))
+        if n == 0:
+            return 0.0
+        return float(self.cumulative[n - 1])
+
+
+class OrderBook():
+    """
+    In-memory L2 book of one (exchange, currency), updated from get_orderbook snapshots.
+    """
+    def __init__(self):
+        self.bids = BookSide(-1)
+        self.asks = BookSide(1)
+        self.timestamp = None
+
+    def apply_snapshot(self, orderbook):
+        """
+        orderbook: get_orderbook() result
+        return number of changed levels
+        """
+        self.timestamp = orderbook['timestamp']
+        changes = self.bids.apply(*levels_to_arrays(orderbook['bids']))
+        changes += self.asks.apply(*levels_to_arrays(orderbook['asks']))
+        return changes
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def mid_price(self):
+        bid = self.best_bid()
+        ask = self.best_ask()
+        if bid is None or ask is None:
+            return None
+        return (bid + ask) / 2
+
+    def spread(self):
+        bid = self.best_bid()
+        ask = self.best_ask()
+        if bid is None or ask is None:
+            return None
+        return ask - bid
+
+    def depth(self, levels):
+        """
+        return (bid quantity, ask quantity) of the best levels on each side
+        """
+        return self.bids.depth(levels), self.asks.depth(levels)
+
+    def bid_volume_to(self, price):
+        return self.bids.volume_to(price)
+
+    def ask_volume_to(self, price):
+        return self.asks.volume_to(price)
+
+    def imbalance(self, levels):
+        """
+        (bid - ask) / (bid + ask) quantity of the best levels, in [-1, 1]
+        """
+        bid, ask = self.depth(levels)
+        total = bid + ask
+        if total == 0:
+            return 0.0
+        return (bid - ask) / total
+
+
+class OrderbookFeaturizer():
+    """
+    Maps an order book onto a fixed tick grid around the last price.
+
+    bid level i holds the quantity at last - i * tick_size, ask level i the
+    quantity at last + i * tick_size (i = 0 .. levels-1). Each side is then
+    divided by its mean. Returns the same preallocated float32 vector
+    [bids..., asks...] on every call.
+    """
+    def __init__(self, tick_size=None, levels=20):
+        self.tick_size = tick_size
+        self.levels = levels
+        self.features = np.zeros(2 * levels, dtype=np.float32)
+
+    def size(self):
+        return 2 * self.levels
+
+    def infer_tick_size(self, bid_prices, ask_prices):
+        prices = np.concatenate((bid_prices, ask_prices))
+        steps = np.diff(np.unique(prices))
+        if len(steps) == 0:
+            return None
+        return float(steps.min())
+
+    def fill_side(self, out, offsets, quantities, tick_size):
+        index = np.rint(offsets / tick_size).astype(np.int64)
+        valid = (index >= 0) & (index < self.levels)
+        out[:] = np.bincount(index[valid], weights=quantities[valid], minlength=self.levels)
+        mean = out.mean()
+        if mean > 0:
+            out /= mean
+
+    def featurize(self, last, bid_prices, bid_quantities, ask_prices, ask_quantities):
+        tick_size = self.tick_size
+        if tick_size is None:
+            tick_size = self.infer_tick_size(bid_prices, ask_prices)
+        if tick_size is None:
+            self.features[:] = 0.0
+            return self.features
+
+        self.fill_side(self.features[:self.levels], last - bid_prices, bid_quantities, tick_size)
+        self.fill_side(self.features[self.levels:], ask_prices - last, ask_quantities, tick_size)
+        return self.features
+
+    def featurize_book(self, book, last):
+        return self.featurize(last, book.bids.prices(), book.bids.quantities,
+                book.asks.prices(), book.asks.quantities)
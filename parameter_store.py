@@ -0,0 +1,122 @@
+import time
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class ParameterStore():
+    """
+    The global model's weights in one contiguous float32 buffer behind a
+    version counter, bumped by every publish.
+
+    shapes: shapes of the model's get_weights() list
+    shared: keep the buffer in shared memory for actor processes, which
+    attach with ParameterStore(*store.handle())
+
+    The version is odd while a publish is in progress, so readers in other
+    processes can tell a torn copy and retry.
+    """
+    HEADER = 8
+
+    def __init__(self, shapes, name=None, shared=False):
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.offsets = [0]
+        for shape in self.shapes:
+            self.offsets.append(self.offsets[-1] + int(np.prod(shape)))
+        self.size = self.offsets[-1]
+        nbytes = self.HEADER + self.size * 4
+
+        self.shm = None
+        if name is not None:
+            self.shm = shared_memory.SharedMemory(name=name)
+            buffer = self.shm.buf
+        elif shared:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            buffer = self.shm.buf
+        else:
+            buffer = bytearray(nbytes)
+
+        self.counter = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=0)
+        self.flat = np.ndarray((self.size,), dtype=np.float32, buffer=buffer, offset=self.HEADER)
+        self.views = self.make_views(self.flat)
+        if name is None:
+            self.counter[0] = 0
+        # publishers of this process, the version protects readers only
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_weights(cls, weights, shared=False):
+        store = cls([w.shape for w in weights], shared=shared)
+        store.publish(weights)
+        return store
+
+    def handle(self):
+        """
+        arguments for attaching to this store from another process
+        """
+        return self.shapes, self.shm.name
+
+    def make_views(self, flat):
+        return [flat[self.offsets[i]:self.offsets[i + 1]].reshape(self.shapes[i])
+                for i in range(len(self.shapes))]
+
+    @property
+    def version(self):
+        return int(self.counter[0])
+
+    def publish(self, weights):
+        with self.lock:
+            self.counter[0] += 1
+            for view, w in zip(self.views, weights):
+                view[...] = w
+            self.counter[0] += 1
+
+    def read(self, out, last_version):
+        """
+        copy the weights into out (size floats) if the version moved from last_version
+        return the version now in out
+        """
+        while True:
+            version = self.version
+            if version == last_version:
+                return last_version
+            if version % 2 == 1:
+                time.sleep(0)
+                continue
+            np.copyto(out, self.flat)
+            if self.version == version:
+                return version
+
+    def replica(self):
+        return ParameterReplica(self)
+
+    def close(self, unlink=False):
+        if self.shm is None:
+            return
+        del self.counter, self.flat, self.views
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class ParameterReplica():
+    """
+    A worker's copy of a ParameterStore with preallocated per-layer views,
+    synced into a local model only when the store's version changed.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.flat = np.zeros(store.size, dtype=np.float32)
+        self.views = store.make_views(self.flat)
+        self.version = -1
+
+    def sync(self, model):
+        """
+        return True if model got new weights, False if it was up to date
+        """
+        version = self.store.read(self.flat, self.version)
+        if version == self.version:
+            return False
+        model.set_weights(self.views)
+        self.version = version
+        return True
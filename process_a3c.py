@@ -0,0 +1,215 @@
+import time
+import queue
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from metrics import METRICS
+from parameter_store import ParameterStore
+from rollout import RolloutBuffer
+
+logger = logging.getLogger("m2bitcoin.a3c")
+
+# actor processes start from a fresh interpreter, no forked TF state
+CONTEXT = multiprocessing.get_context("spawn")
+
+
+class TrajectorySlot():
+    """
+    One RolloutBuffer in shared memory, filled by an actor and trained on by
+    the learner.
+    """
+    def __init__(self, t_max, state_shape, discount_factor=0.99, gae_lambda=None, name=None):
+        create = name is None
+        size = RolloutBuffer.nbytes(t_max, state_shape)
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.rollout = RolloutBuffer(t_max, state_shape, discount_factor, gae_lambda, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self, unlink=False):
+        del self.rollout
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def run_actor(actor_id, env_kwargs, t_max, store_handle, slot_names, slot_free,
+        messages, stopped):
+    """
+    actor process: trade its own Env with a local model, write rollouts into
+    its two slots in turn and tell the learner through messages
+    """
+    from trade_a3c import A3CAgent
+    from environment import Env
+
+    env = Env(**env_kwargs)
+    history_size = env.history_size()
+    state_size = env.state_size()
+    action_size = env.action_size()
+
+    _, _, local_model = A3CAgent.build_model(history_size, state_size, action_size)
+    store = ParameterStore(*store_handle)
+    replica = store.replica()
+
+    slots = [TrajectorySlot(t_max, (history_size, state_size), name=name) for name in slot_names]
+    rollouts = 0
+
+    state = env.reset()
+    score, step, p_max = 0, 0, 0.0
+    prediction = None
+    while not stopped.is_set():
+        replica.sync(local_model)
+
+        index = rollouts % len(slots)
+        slot = slots[index]
+        # the learner still trains on this slot's previous rollout
+        while not slot_free[index].wait(1.0):
+            if stopped.is_set():
+                break
+        if stopped.is_set():
+            break
+        slot_free[index].clear()
+
+        rollout = slot.rollout
+        rollout.clear()
+        done = False
+        while not rollout.full() and not done:
+            if prediction is None:
+                prediction = local_model.predict(state.reshape(1, history_size, state_size))
+            policy, value = prediction[0][0], prediction[1][0][0]
+            prediction = None
+            action = np.random.choice(action_size, 1, p=policy)[0]
+            next_state, reward, done, info = env.step(action)
+
+            rollout.append(state, action, np.clip(reward, -1., 1.), value, done)
+
+            p_max += np.amax(policy)
+            score += reward
+            step += 1
+            state = next_state
+
+        bootstrap = 0.0
+        if not done:
+            # V(next_state), its policy picks the next action
+            prediction = local_model.predict(state.reshape(1, history_size, state_size))
+            bootstrap = float(prediction[1][0][0])
+
+        messages.put(("rollout", actor_id, index, len(rollout), bootstrap))
+        rollouts += 1
+
+        if done:
+            messages.put(("episode", actor_id, score, p_max / float(step), step))
+            state = env.reset()
+            score, step, p_max = 0, 0, 0.0
+
+    # drop the views into the slots before closing them
+    rollout = slot = None
+    for each in slots:
+        each.close()
+    store.close()
+
+
+class ProcessLearner():
+    """
+    Process based A3C: workers actor processes each run an Env and a local
+    model, the learner (this process) trains the global A3CAgent model on
+    their rollouts and publishes the new weights to a shared ParameterStore.
+
+    Actors poll the exchange themselves, a MarketFeed can not be shared
+    across processes. run() raises if an actor process dies.
+    """
+    # seconds between actor liveness checks while no message arrives
+    POLL_TIMEOUT = 1.0
+    # seconds stop() waits for an actor before terminating it
+    JOIN_TIMEOUT = 10.0
+
+    def __init__(self, agent, env_kwargs, workers, t_max=20):
+        self.agent = agent
+        self.env_kwargs = env_kwargs
+        self.workers = workers
+        self.t_max = t_max
+
+        self.store = ParameterStore.from_weights(agent.model.get_weights(), shared=True)
+
+        self.slots = [[TrajectorySlot(t_max, (agent.history_size, agent.state_size),
+                    agent.discount_factor, agent.gae_lambda) for _ in range(2)]
+                for _ in range(workers)]
+        self.slot_free = [[CONTEXT.Event() for _ in range(2)] for _ in range(workers)]
+        for events in self.slot_free:
+            for event in events:
+                event.set()
+        self.messages = CONTEXT.Queue()
+        self.stopped = CONTEXT.Event()
+        self.processes = []
+        self.episode = agent.start_episode
+
+    def start(self):
+        for actor_id in range(self.workers):
+            process = CONTEXT.Process(target=run_actor, args=(actor_id, self.env_kwargs, self.t_max,
+                self.store.handle(), [slot.name for slot in self.slots[actor_id]],
+                self.slot_free[actor_id], self.messages, self.stopped), daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def stop(self):
+        self.stopped.set()
+        for process in self.processes:
+            # an actor may be stuck in an exchange request
+            process.join(self.JOIN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for slots in self.slots:
+            for slot in slots:
+                slot.close(unlink=True)
+        self.store.close(unlink=True)
+
+    def train_rollout(self, slot, count, bootstrap):
+        agent = self.agent
+        rollout = slot.rollout
+        # the actor filled it, its count lives in the actor process
+        rollout.count = count
+        discounted_prediction, advantages = rollout.compute(bootstrap)
+
+        agent.optimizer[0]([rollout.states[:count], rollout.actions[:count], advantages])
+        agent.optimizer[1]([rollout.states[:count], discounted_prediction])
+
+    def check_actors(self):
+        """
+        actors only exit after stop(), raise if one is gone
+        """
+        for actor_id, process in enumerate(self.processes):
+            if not process.is_alive():
+                raise Exception('Actor {} exited with code {}'.format(actor_id, process.exitcode))
+
+    def run(self, episodes):
+        saved = time.time()
+        while self.episode < episodes:
+            self.check_actors()
+            try:
+                message = self.messages.get(timeout=self.POLL_TIMEOUT)
+            except queue.Empty:
+                continue
+            if message[0] == "rollout":
+                _, actor_id, index, count, bootstrap = message
+                started = time.perf_counter()
+                self.train_rollout(self.slots[actor_id][index], count, bootstrap)
+                self.slot_free[actor_id][index].set()
+                trained = time.perf_counter()
+                self.store.publish(self.agent.model.get_weights())
+                METRICS.observe("train", trained - started)
+                METRICS.observe("sync", time.perf_counter() - trained)
+            elif message[0] == "episode":
+                _, actor_id, score, avg_p_max, step = message
+                self.episode += 1
+                logger.info("episode: %d actor: %d score: %s step: %d", self.episode, actor_id, score, step)
+                METRICS.summary('Total Reward/Episode', score, self.episode + 1)
+                METRICS.summary('Average Max Prob/Episode', avg_p_max, self.episode + 1)
+                METRICS.summary('Duration/Episode', step, self.episode + 1)
+
+            if time.time() - saved > self.agent.checkpoint_interval:
+                self.agent.checkpoint(self.episode)
+                saved = time.time()
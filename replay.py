@@ -0,0 +1,199 @@
+import time
+import json
+import sys, getopt
+from exchange import Exchange, make_ticker_table
+from bithumb import BithumbExchange
+from korbit import KorbitExchange
+
+
+SOURCE_EXCHANGES = { "Bithumb": BithumbExchange, "Korbit": KorbitExchange }
+
+
+class ReplayExchange(Exchange):
+    """
+    Serves recorded Bithumb/Korbit observations from a capture file.
+
+    A capture file holds one JSON frame per line:
+        {"time": 1530000000.123, "exchange": "Bithumb", "currency": "BTC",
+         "ticker": {...}, "recent": ..., "orderbook": {...}}
+    ticker/recent/orderbook are what the live exchange's get_ticker/poll/
+    get_orderbook returned, so get_states builds exactly the same states
+    with the source exchange's build_states and STATE_SCHEMA.
+
+    speed: 1.0 replays in real time, N replays N times faster and 0 replays
+    as fast as possible.
+    """
+    LIVE = False
+
+    def __init__(self, capture_path, speed=0.0, loop=True):
+        super().__init__()
+        self.capture_path = capture_path
+        self.speed = speed
+        self.loop = loop
+
+        self.source = None
+        self.frames = {}
+        with open(capture_path) as f:
+            for line in f:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                frame = json.loads(line)
+                if self.source is None:
+                    self.source = frame['exchange']
+                self.frames.setdefault(frame['currency'], []).append(frame)
+
+        if self.source not in SOURCE_EXCHANGES:
+            raise Exception('Not support capture exchange: {}'.format(self.source))
+        self.source_exchange = SOURCE_EXCHANGES[self.source]
+        self.STATE_SCHEMA = self.source_exchange.STATE_SCHEMA
+
+        self.cursor = {}
+        self.clock_start = {}
+
+    def check_currency(self, currency_type):
+        if currency_type is None:
+            raise Exception('Need to currency type')
+        if currency_type not in self.frames:
+            raise Exception('Not support currency type')
+
+    def current_frame(self, currency):
+        index = self.cursor.get(currency, 0)
+        return self.frames[currency][index]
+
+    def wait_frame(self, currency, frame):
+        if self.speed <= 0:
+            return
+
+        now = time.time()
+        if currency not in self.clock_start:
+            self.clock_start[currency] = (now, frame['time'])
+            return
+
+        wall_start, capture_start = self.clock_start[currency]
+        delay = (frame['time'] - capture_start) / self.speed - (now - wall_start)
+        if delay > 0:
+            time.sleep(delay)
+
+    def next_frame(self, currency):
+        frames = self.frames[currency]
+        index = self.cursor.get(currency, -1) + 1
+        if index >= len(frames):
+            if not self.loop:
+                raise EOFError('End of capture: {}'.format(self.capture_path))
+            index = 0
+            self.clock_start.pop(currency, None)
+
+        self.cursor[currency] = index
+        frame = frames[index]
+        self.wait_frame(currency, frame)
+        return frame
+
+    def get_ticker(self, currency_type=None):
+        self.check_currency(currency_type)
+        return self.current_frame(currency_type)['ticker']
+
+    def get_all_tickers(self):
+        tickers = []
+        for currency in self.frames.keys():
+            tickers.append((currency, self.current_frame(currency)['ticker']))
+        return make_ticker_table(tickers)
+
+    def get_orderbook(self, currency_type=None, count=10):
+        self.check_currency(currency_type)
+        orderbook = self.current_frame(currency_type).get('orderbook')
+        if orderbook is None:
+            return None
+
+        result = {}
+        result["timestamp"] = orderbook["timestamp"]
+        result["bids"] = orderbook["bids"][:count]
+        result["asks"] = orderbook["asks"][:count]
+        return result
+
+    def get_recent(self, currency_type=None, count=10):
+        self.check_currency(currency_type)
+        recent = self.current_frame(currency_type)['recent']
+        # Bithumb captures hold the single aligned trade, Korbit the list
+        if isinstance(recent, list):
+            return recent[:count]
+        return [recent]
+
+    def get_fee(self):
+        return self.source_exchange.FEE_PERCENT
+
+    def poll(self, currency):
+        self.check_currency(currency)
+        frame = self.next_frame(currency)
+        return frame['ticker'], frame['recent']
+
+    def parse_trade(self, recent):
+        return self.source_exchange.parse_trade(recent)
+
+    def build_states(self, ticker, recent, out):
+        return self.source_exchange.build_states(ticker, recent, out)
+
+    def tick_size(self, currency):
+        return getattr(self.source_exchange, 'TRADE_UNIT', {}).get(currency)
+
+    def get_states(self, currency, out=None):
+        if out is None:
+            out = self.state_schema(currency).allocate()
+        return self.observe(currency, out)
+
+    def reset(self):
+        pass
+
+
+def record(exchange_name, currencies, capture_path, count=0, orderbook=False):
+    """
+    poll the live exchange and append frames for ReplayExchange to capture_path
+    count: number of rounds to record, 0 records until interrupted
+    """
+    exchange = SOURCE_EXCHANGES[exchange_name]()
+
+    rounds = 0
+    with open(capture_path, 'a') as f:
+        while count == 0 or rounds < count:
+            for currency in currencies:
+                # poll would wait for a new trade and hold up the other currencies
+                matched = exchange.poll_once(currency)
+                if matched is None:
+                    continue
+                ticker, recent = matched
+                frame = {}
+                frame['time'] = time.time()
+                frame['exchange'] = exchange_name
+                frame['currency'] = currency
+                frame['ticker'] = ticker
+                frame['recent'] = recent
+                if orderbook:
+                    frame['orderbook'] = exchange.get_orderbook(currency, 20)
+                f.write(json.dumps(frame) + '\n')
+            f.flush()
+            rounds = rounds + 1
+            time.sleep(exchange.POLL_INTERVAL)
+
+
+# -e Bithumb -c BTC,ETH -o capture.jsonl [-n rounds] [-b]
+if __name__ == "__main__":
+    myopts, args = getopt.getopt(sys.argv[1:], "e:c:o:n:b")
+    exchange = 'Bithumb'
+    currencies = ['BTC']
+    capture_path = 'capture.jsonl'
+    count = 0
+    orderbook = False
+
+    for o, a in myopts:
+        if o == '-e':
+            exchange = a
+        elif o == '-c':
+            currencies = a.split(',')
+        elif o == '-o':
+            capture_path = a
+        elif o == '-n':
+            count = int(a)
+        elif o == '-b':
+            orderbook = True
+
+    record(exchange, currencies, capture_path, count, orderbook)
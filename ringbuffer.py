@@ -0,0 +1,108 @@
+import numpy as np
+
+
+class TimeRing():
+    """
+    Fixed-capacity ring of items keyed by non-decreasing int64 epoch-ms.
+    When full the oldest item is overwritten, so memory stays bounded.
+    Lookups are binary searches over the (at most two) sorted key segments.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.keys = np.zeros(capacity, dtype=np.int64)
+        self.items = [None] * capacity
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def physical(self, index):
+        return (self.start + index) % self.capacity
+
+    def last_key(self):
+        if self.count == 0:
+            return None
+        return int(self.keys[self.physical(self.count - 1)])
+
+    def push(self, key, item):
+        """
+        return False if key is older than the newest key (item dropped)
+        """
+        last = self.last_key()
+        if last is not None and key < last:
+            return False
+
+        if self.count == self.capacity:
+            # overwrite the oldest
+            self.start = (self.start + 1) % self.capacity
+            self.count = self.count - 1
+
+        pos = self.physical(self.count)
+        self.keys[pos] = key
+        self.items[pos] = item
+        self.count = self.count + 1
+        return True
+
+    def count_le(self, key):
+        """
+        number of items whose key <= key
+        """
+        end = self.start + self.count
+        if end <= self.capacity:
+            return int(np.searchsorted(self.keys[self.start:end], key, side='right'))
+
+        first = self.keys[self.start:]
+        n = int(np.searchsorted(first, key, side='right'))
+        if n < len(first):
+            return n
+        return n + int(np.searchsorted(self.keys[:end - self.capacity], key, side='right'))
+
+    def asof(self, key):
+        """
+        return (index, key, item) of the newest item with key <= key, or None
+        """
+        index = self.count_le(key) - 1
+        if index < 0:
+            return None
+        pos = self.physical(index)
+        return index, int(self.keys[pos]), self.items[pos]
+
+    def drop_through(self, index):
+        """
+        discard items 0..index (oldest first)
+        """
+        n = min(index + 1, self.count)
+        for i in range(n):
+            self.items[self.physical(i)] = None
+        self.start = self.physical(n)
+        self.count = self.count - n
+
+    def clear(self):
+        self.drop_through(self.count - 1)
+
+
+class ObservationWindow():
+    """
+    Last `length` observations as a contiguous (length, size) array, oldest first.
+
+    Every observation is written twice, at pos and pos + length, so the
+    window is always the slice buffer[pos:pos + length] and view() never
+    copies or rebuilds anything.
+    """
+    def __init__(self, length, size, dtype=np.float64):
+        self.length = length
+        self.buffer = np.zeros((2 * length, size), dtype=dtype)
+        self.pos = 0
+
+    def fill(self, observation):
+        self.buffer[:] = observation
+        self.pos = 0
+
+    def push(self, observation):
+        self.buffer[self.pos] = observation
+        self.buffer[self.pos + self.length] = observation
+        self.pos = (self.pos + 1) % self.length
+
+    def view(self):
+        return self.buffer[self.pos:self.pos + self.length]
@@ -0,0 +1,122 @@
+import numpy as np
+from schema import STATE_DTYPE
+
+
+class RolloutBuffer():
+    """
+    Fixed capacity rollout of one worker: states, int actions, rewards, the
+    values predicted while acting and dones, in preallocated arrays.
+
+    compute() turns a rollout into discounted returns and advantages with
+    matrix products over precomputed discount powers instead of a loop, or
+    into GAE(lambda) advantages if gae_lambda is set.
+
+    buffer: memory to lay the arrays out in (e.g. a SharedMemory's buf),
+    at least RolloutBuffer.nbytes(capacity, state_shape) long
+    """
+    def __init__(self, capacity, state_shape, discount_factor=0.99, gae_lambda=None, buffer=None):
+        self.capacity = capacity
+        self.state_shape = tuple(state_shape)
+        self.discount_factor = discount_factor
+        self.gae_lambda = gae_lambda
+
+        if buffer is None:
+            buffer = bytearray(self.nbytes(capacity, state_shape))
+        states_size = capacity * int(np.prod(state_shape))
+        offset = 0
+        self.states = np.ndarray((capacity,) + self.state_shape, dtype=STATE_DTYPE, buffer=buffer, offset=offset)
+        offset += states_size * 4
+        self.actions = np.ndarray((capacity,), dtype=np.int32, buffer=buffer, offset=offset)
+        offset += capacity * 4
+        self.rewards = np.ndarray((capacity,), dtype=np.float32, buffer=buffer, offset=offset)
+        offset += capacity * 4
+        self.values = np.ndarray((capacity,), dtype=np.float32, buffer=buffer, offset=offset)
+        offset += capacity * 4
+        self.dones = np.ndarray((capacity,), dtype=np.bool_, buffer=buffer, offset=offset)
+
+        self.returns = np.zeros(capacity, dtype=np.float32)
+        self.advantages = np.zeros(capacity, dtype=np.float32)
+        self.deltas = np.zeros(capacity, dtype=np.float32)
+
+        # discounts[t, k] = gamma^(k - t) for k >= t, 0 below the diagonal
+        exponents = np.arange(capacity)[None, :] - np.arange(capacity)[:, None]
+        self.discounts = np.triu(discount_factor ** np.maximum(exponents, 0)).astype(np.float32)
+        # gamma^0 .. gamma^capacity, the bootstrap weight of step t is gamma^(n - t)
+        self.powers = (discount_factor ** np.arange(capacity + 1)).astype(np.float32)
+        if gae_lambda is not None:
+            self.gae_discounts = np.triu((discount_factor * gae_lambda) ** np.maximum(exponents, 0)).astype(np.float32)
+
+        self.count = 0
+
+    @staticmethod
+    def nbytes(capacity, state_shape):
+        return capacity * int(np.prod(state_shape)) * 4 + capacity * 4 * 3 + capacity
+
+    def __len__(self):
+        return self.count
+
+    def full(self):
+        return self.count >= self.capacity
+
+    def clear(self):
+        self.count = 0
+
+    def append(self, state, action, reward, value, done=False):
+        i = self.count
+        self.states[i] = state.reshape(self.state_shape)
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.values[i] = value
+        self.dones[i] = done
+        self.count = i + 1
+
+    def segment_mask(self, n):
+        """
+        None if only the last step may be done, otherwise (n, n) mask of
+        steps in the same episode, so returns do not cross an episode end
+        """
+        dones = self.dones[:n]
+        if not dones[:n - 1].any():
+            return None
+        episode = np.cumsum(dones) - dones
+        return episode[:, None] == episode[None, :]
+
+    def compute(self, bootstrap=0.0):
+        """
+        bootstrap: V(next_state) after the last step, ignored if it is done
+        return returns, advantages of the count steps (views, valid until the next compute)
+        """
+        n = self.count
+        rewards = self.rewards[:n]
+        values = self.values[:n]
+        returns = self.returns[:n]
+        advantages = self.advantages[:n]
+
+        mask = self.segment_mask(n)
+        if self.dones[n - 1]:
+            bootstrap = 0.0
+
+        if self.gae_lambda is None:
+            discounts = self.discounts[:n, :n] if mask is None else self.discounts[:n, :n] * mask
+            np.dot(discounts, rewards, out=returns)
+            # bootstrap reaches the steps of the last episode only
+            tail = self.powers[n:0:-1] * bootstrap
+            if mask is not None:
+                tail = tail * mask[:, n - 1]
+            returns += tail
+            np.subtract(returns, values, out=advantages)
+        else:
+            # delta_t = r_t + gamma * V(t + 1) * (1 - done_t) - V(t)
+            deltas = self.deltas[:n]
+            deltas[:n - 1] = values[1:]
+            deltas[n - 1] = bootstrap
+            deltas[self.dones[:n]] = 0.0
+            deltas *= self.discount_factor
+            deltas += rewards
+            deltas -= values
+
+            discounts = self.gae_discounts[:n, :n] if mask is None else self.gae_discounts[:n, :n] * mask
+            np.dot(discounts, deltas, out=advantages)
+            np.add(advantages, values, out=returns)
+
+        return returns, advantages
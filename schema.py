@@ -0,0 +1,37 @@
+import numpy as np
+
+
+STATE_DTYPE = np.float32
+
+
+class StateSchema():
+    """
+    Fixed layout of a state vector: named fields of fixed size at fixed offsets.
+
+    fields: list of (name, size)
+    """
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.offsets = {}
+        self.slices = {}
+        offset = 0
+        for name, size in self.fields:
+            self.offsets[name] = offset
+            self.slices[name] = slice(offset, offset + size)
+            offset = offset + size
+        self.size = offset
+
+    def __len__(self):
+        return self.size
+
+    def offset(self, name):
+        return self.offsets[name]
+
+    def slice(self, name):
+        return self.slices[name]
+
+    def extend(self, fields):
+        return StateSchema(self.fields + list(fields))
+
+    def allocate(self, *shape):
+        return np.zeros(shape + (self.size,), dtype=STATE_DTYPE)
@@ -0,0 +1,221 @@
+import time
+import threading
+from collections import deque
+from urllib.parse import parse_qs
+import numpy as np
+
+
+class SyntheticMarket():
+    """
+    Random walk market answering with the raw JSON payloads of the Bithumb
+    and Korbit public APIs, for running the exchange classes offline.
+
+    Trades are generated lazily: a transactions request first catches up on
+    the trades due since the last one, one every trade_interval seconds
+    (trade_interval=0 makes a new trade per request). Timestamps come from
+    clock, so tickers and trades line up like on the live exchanges.
+    """
+    KORBIT_PAIRS = { "btc_krw": "BTC", "eth_krw": "ETH", "ltc_krw": "LTC",
+            "etc_krw": "ETC", "xrp_krw": "XRP", "bch_krw": "BCH", "btg_krw": "BTG" }
+
+    # trades kept per currency for transactions requests
+    TRADE_HISTORY = 100
+
+    def __init__(self, currencies=("BTC", "ETH"), start_price=8000000.0, tick=1000.0,
+            volatility=0.0005, trade_interval=0.0, seed=None, clock=time.time):
+        self.currencies = list(currencies)
+        self.tick = tick
+        self.volatility = volatility
+        self.trade_interval = trade_interval
+        self.random = np.random.RandomState(seed)
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.markets = {}
+        now = self.clock()
+        for currency in self.currencies:
+            market = {}
+            market['open'] = start_price
+            market['price'] = start_price
+            market['high'] = start_price
+            market['low'] = start_price
+            market['volume'] = 0.0
+            market['cont_no'] = 0
+            market['next_trade'] = now
+            market['trades'] = deque(maxlen=self.TRADE_HISTORY)
+            self.markets[currency] = market
+
+    def trade(self, currency, now):
+        market = self.markets[currency]
+        step = self.random.normal(0.0, self.volatility) * market['price']
+        price = max(self.tick, round((market['price'] + step) / self.tick) * self.tick)
+        units = round(float(self.random.exponential(0.5)) + 0.0001, 4)
+
+        market['price'] = price
+        market['high'] = max(market['high'], price)
+        market['low'] = min(market['low'], price)
+        market['volume'] += units
+        market['cont_no'] += 1
+        market['trades'].appendleft({
+            'cont_no': market['cont_no'],
+            'time': now,
+            'price': price,
+            'units': units,
+            'buy': bool(self.random.rand() < 0.5)})
+
+    def catch_up(self, currency):
+        now = self.clock()
+        market = self.markets[currency]
+        if self.trade_interval <= 0:
+            self.trade(currency, now)
+            return
+        due = 0
+        while market['next_trade'] <= now and due < self.TRADE_HISTORY:
+            self.trade(currency, market['next_trade'])
+            market['next_trade'] += self.trade_interval
+            due += 1
+        if market['next_trade'] <= now:
+            market['next_trade'] = now + self.trade_interval
+
+    def book(self, currency, count):
+        price = self.markets[currency]['price']
+        bids = []
+        asks = []
+        for i in range(count):
+            bids.append((price - (i + 1) * self.tick, round(float(self.random.exponential(1.0)), 4)))
+            asks.append((price + (i + 1) * self.tick, round(float(self.random.exponential(1.0)), 4)))
+        return bids, asks
+
+    ## Bithumb, {"status": "0000", "data": ...}
+    def bithumb_ticker_data(self, currency):
+        market = self.markets[currency]
+        price = market['price']
+        return {
+            "opening_price": "%d" % market['open'],
+            "closing_price": "%d" % price,
+            "min_price": "%d" % market['low'],
+            "max_price": "%d" % market['high'],
+            "average_price": "%.4f" % ((market['high'] + market['low']) / 2),
+            "units_traded": "%.8f" % market['volume'],
+            "volume_1day": "%.8f" % market['volume'],
+            "volume_7day": "%.8f" % (market['volume'] * 7),
+            "buy_price": "%d" % (price - self.tick),
+            "sell_price": "%d" % (price + self.tick),
+            "24H_fluctate": "%d" % (price - market['open']),
+            "24H_fluctate_rate": "%.2f" % ((price - market['open']) / market['open'] * 100)}
+
+    def bithumb_ticker(self, currency):
+        data = self.bithumb_ticker_data(currency)
+        data["date"] = "%d" % int(self.clock() * 1000)
+        return {"status": "0000", "data": data}
+
+    def bithumb_ticker_all(self):
+        data = {}
+        for currency in self.currencies:
+            data[currency] = self.bithumb_ticker_data(currency)
+        data["date"] = "%d" % int(self.clock() * 1000)
+        return {"status": "0000", "data": data}
+
+    def bithumb_orderbook(self, currency, count):
+        bids, asks = self.book(currency, count)
+        return {"status": "0000", "data": {
+            "timestamp": "%d" % int(self.clock() * 1000),
+            "order_currency": currency,
+            "payment_currency": "KRW",
+            "bids": [{"quantity": "%.4f" % q, "price": "%d" % p} for p, q in bids],
+            "asks": [{"quantity": "%.4f" % q, "price": "%d" % p} for p, q in asks]}}
+
+    def bithumb_recent(self, currency, count):
+        self.catch_up(currency)
+        data = []
+        for trade in list(self.markets[currency]['trades'])[:count]:
+            data.append({
+                "cont_no": "%d" % trade['cont_no'],
+                # local time with second resolution, like the ticker date
+                "transaction_date": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(trade['time'])),
+                "type": "bid" if trade['buy'] else "ask",
+                "units_traded": "%.4f" % trade['units'],
+                "price": "%d" % trade['price'],
+                "total": "%d" % (trade['price'] * trade['units'])})
+        return {"status": "0000", "data": data}
+
+    ## Korbit, plain objects
+    def korbit_ticker(self, currency):
+        market = self.markets[currency]
+        price = market['price']
+        return {
+            "timestamp": int(self.clock() * 1000),
+            "last": "%d" % price,
+            "bid": "%d" % (price - self.tick),
+            "ask": "%d" % (price + self.tick),
+            "low": "%d" % market['low'],
+            "high": "%d" % market['high'],
+            "volume": "%.8f" % market['volume'],
+            "change": "%d" % (price - market['open']),
+            "changePercent": "%.2f" % ((price - market['open']) / market['open'] * 100)}
+
+    def korbit_orderbook(self, currency, count=30):
+        bids, asks = self.book(currency, count)
+        return {
+            "timestamp": int(self.clock() * 1000),
+            "bids": [["%d" % p, "%.4f" % q, "1"] for p, q in bids],
+            "asks": [["%d" % p, "%.4f" % q, "1"] for p, q in asks]}
+
+    def korbit_transactions(self, currency, count=20):
+        self.catch_up(currency)
+        result = []
+        for trade in list(self.markets[currency]['trades'])[:count]:
+            result.append({
+                "timestamp": int(trade['time'] * 1000),
+                "tid": "%d" % trade['cont_no'],
+                "price": "%d" % trade['price'],
+                "amount": "%.4f" % trade['units'],
+                "type": "buy" if trade['buy'] else "sell"})
+        return result
+
+    def response(self, exchange, path, query=""):
+        """
+        payload for a GET of path?query on exchange ("Bithumb" or "Korbit"),
+        or None for an unknown path or currency
+        """
+        params = parse_qs(query)
+        with self.lock:
+            if exchange == "Bithumb":
+                return self.bithumb_response(path, params)
+            elif exchange == "Korbit":
+                return self.korbit_response(path, params)
+        return None
+
+    def bithumb_response(self, path, params):
+        parts = path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "public":
+            return None
+        endpoint, currency = parts[1], parts[2]
+        count = int(params.get("count", ["20"])[0])
+        if endpoint == "ticker" and currency == "ALL":
+            return self.bithumb_ticker_all()
+        if currency not in self.markets:
+            return {"status": "5500", "message": "Invalid Parameter"}
+        if endpoint == "ticker":
+            return self.bithumb_ticker(currency)
+        elif endpoint == "orderbook":
+            return self.bithumb_orderbook(currency, count)
+        elif endpoint == "recent_transactions":
+            return self.bithumb_recent(currency, count)
+        return None
+
+    def korbit_response(self, path, params):
+        # the Korbit BASE_API_URL carries the version prefix
+        if path.startswith("/v1/"):
+            path = path[3:]
+        pair = params.get("currency_pair", ["btc_krw"])[0]
+        currency = self.KORBIT_PAIRS.get(pair)
+        if currency not in self.markets:
+            return None
+        if path == "/ticker/detailed":
+            return self.korbit_ticker(currency)
+        elif path == "/orderbook":
+            return self.korbit_orderbook(currency)
+        elif path == "/transactions":
+            return self.korbit_transactions(currency)
+        return None
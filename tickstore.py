@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import sys, getopt
+import numpy as np
+
+
+# column name, dtype
+TICK_FIELDS = [
+    ("timestamp", np.int64),
+    ("last", np.float64),
+    ("bid", np.float64),
+    ("ask", np.float64),
+    ("high", np.float64),
+    ("low", np.float64),
+    ("volume", np.float64),
+    ("trade_price", np.float64),
+    ("trade_units", np.float64),
+    ("trade_side", np.int8),
+]
+
+# one (timestamp, row) index entry every INDEX_STRIDE ticks
+INDEX_STRIDE = 4096
+# columns grow by this many rows at a time
+CHUNK_ROWS = 1 << 16
+
+
+def make_tick(ticker, trade):
+    """
+    ticker: get_ticker() result, trade: parse_trade() result
+    """
+    tick = {}
+    tick["timestamp"] = int(ticker['timestamp'])
+    tick["last"] = float(ticker['last'])
+    tick["bid"] = float(ticker['bid'])
+    tick["ask"] = float(ticker['ask'])
+    tick["high"] = float(ticker['high'])
+    tick["low"] = float(ticker['low'])
+    tick["volume"] = float(ticker['volume'])
+    tick["trade_price"], tick["trade_units"], tick["trade_side"] = trade
+    return tick
+
+
+class TickStore():
+    """
+    Columnar tick history on disk, one raw NumPy column file per field:
+
+        root/<exchange>/<currency>/<field>.bin
+        root/<exchange>/<currency>/index.bin   sparse (timestamp, row) int64 pairs
+        root/<exchange>/<currency>/meta.json   committed row count
+
+    Readers map the columns read-only, so every process reading the same
+    range shares the page cache instead of holding its own copy.
+    """
+    def __init__(self, root, exchange):
+        self.root = root
+        self.exchange = exchange
+
+    def currency_dir(self, currency):
+        return os.path.join(self.root, self.exchange, currency)
+
+    def column_path(self, currency, field):
+        return os.path.join(self.currency_dir(currency), field + ".bin")
+
+    def index_path(self, currency):
+        return os.path.join(self.currency_dir(currency), "index.bin")
+
+    def meta_path(self, currency):
+        return os.path.join(self.currency_dir(currency), "meta.json")
+
+    def currencies(self):
+        path = os.path.join(self.root, self.exchange)
+        if not os.path.isdir(path):
+            return []
+        return sorted(os.listdir(path))
+
+    def count(self, currency):
+        try:
+            with open(self.meta_path(currency)) as f:
+                return json.load(f)['count']
+        except FileNotFoundError:
+            return 0
+
+    def writer(self, currency):
+        return TickWriter(self, currency)
+
+    def load_index(self, currency):
+        try:
+            index = np.fromfile(self.index_path(currency), dtype=np.int64)
+        except FileNotFoundError:
+            index = np.zeros(0, dtype=np.int64)
+        return index.reshape(-1, 2)
+
+    def open_columns(self, currency):
+        """
+        return {field: read-only memmap} over all committed rows
+        """
+        count = self.count(currency)
+        columns = {}
+        for field, dtype in TICK_FIELDS:
+            if count == 0:
+                columns[field] = np.zeros(0, dtype=dtype)
+            else:
+                columns[field] = np.memmap(self.column_path(currency, field),
+                        dtype=dtype, mode='r', shape=(count,))
+        return columns
+
+    def find_row(self, currency, timestamps, index, timestamp):
+        """
+        first row whose timestamp >= timestamp, only touching one index block
+        """
+        block = np.searchsorted(index[:, 0], timestamp, side='left') - 1
+        if block < 0:
+            lo = 0
+        else:
+            lo = int(index[block, 1])
+        hi = len(timestamps)
+        if block + 1 < len(index):
+            hi = int(index[block + 1, 1]) + 1
+        return lo + int(np.searchsorted(timestamps[lo:hi], timestamp, side='left'))
+
+    def open_range(self, currency, start=None, end=None):
+        """
+        return {field: memmap view} for start <= timestamp < end (epoch ms)
+        the views share the mapped file, nothing is copied
+        """
+        columns = self.open_columns(currency)
+        timestamps = columns["timestamp"]
+        index = self.load_index(currency)
+
+        lo = 0
+        hi = len(timestamps)
+        if start is not None:
+            lo = self.find_row(currency, timestamps, index, start)
+        if end is not None:
+            hi = self.find_row(currency, timestamps, index, end)
+        hi = max(lo, hi)
+
+        view = {}
+        for field, _ in TICK_FIELDS:
+            view[field] = columns[field][lo:hi]
+        return view
+
+
+class TickWriter():
+    """
+    Appends ticks of one currency. Only one writer per currency.
+    """
+    def __init__(self, store, currency, commit_every=1):
+        self.store = store
+        self.currency = currency
+        self.commit_every = commit_every
+
+        os.makedirs(store.currency_dir(currency), exist_ok=True)
+        self.count = store.count(currency)
+        self.capacity = 0
+        self.columns = {}
+        self.last_timestamp = None
+        self.pending = 0
+
+        self.grow(max(CHUNK_ROWS, self.count))
+        if self.count > 0:
+            self.last_timestamp = int(self.columns["timestamp"][self.count - 1])
+
+    def grow(self, rows):
+        capacity = ((rows + CHUNK_ROWS - 1) // CHUNK_ROWS) * CHUNK_ROWS
+        for field, dtype in TICK_FIELDS:
+            path = self.store.column_path(self.currency, field)
+            nbytes = capacity * np.dtype(dtype).itemsize
+            with open(path, 'ab') as f:
+                if f.tell() < nbytes:
+                    f.truncate(nbytes)
+            self.columns[field] = np.memmap(path, dtype=dtype, mode='r+', shape=(capacity,))
+        self.capacity = capacity
+
+    def append(self, tick):
+        """
+        tick: dict with every TICK_FIELDS key, timestamps must not go backwards
+        return False if the tick was dropped
+        """
+        timestamp = tick["timestamp"]
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            return False
+
+        if self.count >= self.capacity:
+            self.flush()
+            self.grow(self.count + 1)
+
+        row = self.count
+        for field, _ in TICK_FIELDS:
+            self.columns[field][row] = tick[field]
+
+        if row % INDEX_STRIDE == 0:
+            with open(self.store.index_path(self.currency), 'ab') as f:
+                np.array([timestamp, row], dtype=np.int64).tofile(f)
+
+        self.count = row + 1
+        self.last_timestamp = timestamp
+        self.pending = self.pending + 1
+        if self.pending >= self.commit_every:
+            self.commit()
+        return True
+
+    def flush(self):
+        for column in self.columns.values():
+            column.flush()
+
+    def commit(self):
+        """
+        make the appended rows visible to readers
+        """
+        self.flush()
+        path = self.store.meta_path(self.currency)
+        with open(path + ".tmp", 'w') as f:
+            json.dump({"count": self.count}, f)
+        os.replace(path + ".tmp", path)
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.columns = {}
+
+
+class TickRecorder():
+    """
+    Polls an exchange and appends one tick per new ticker/trade for every currency.
+    """
+    def __init__(self, exchange, exchange_name, currencies, root="ticks"):
+        self.exchange = exchange
+        self.currencies = currencies
+        self.store = TickStore(root, exchange_name)
+        self.writers = {}
+        self.prev_keys = {}
+        for currency in currencies:
+            self.writers[currency] = self.store.writer(currency)
+
+    def record_once(self):
+        """
+        one non-blocking poll_once per currency, a quiet currency never holds up the others
+        return number of ticks appended
+        """
+        count = 0
+        for currency in self.currencies:
+            matched = self.exchange.poll_once(currency)
+            if matched is None:
+                continue
+            ticker, recent = matched
+            tick = make_tick(ticker, self.exchange.parse_trade(recent))
+            key = (tick["timestamp"], tick["trade_price"], tick["trade_units"], tick["trade_side"])
+            if self.prev_keys.get(currency) == key:
+                continue
+            self.prev_keys[currency] = key
+            if self.writers[currency].append(tick):
+                count = count + 1
+        return count
+
+    def run(self, interval=1.0):
+        try:
+            while True:
+                self.record_once()
+                time.sleep(interval)
+        finally:
+            self.close()
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+# -e Bithumb [-c BTC,ETH] [-d ticks] [-i interval]
+if __name__ == "__main__":
+    from bithumb import BithumbExchange
+    from korbit import KorbitExchange
+
+    myopts, args = getopt.getopt(sys.argv[1:], "e:c:d:i:")
+    exchange_name = 'Bithumb'
+    currencies = None
+    root = 'ticks'
+    interval = 1.0
+
+    for o, a in myopts:
+        if o == '-e':
+            exchange_name = a
+        elif o == '-c':
+            currencies = a.split(',')
+        elif o == '-d':
+            root = a
+        elif o == '-i':
+            interval = float(a)
+
+    if exchange_name == 'Korbit':
+        exchange = KorbitExchange()
+        if currencies is None:
+            currencies = list(KorbitExchange.CURRENCY_MAP.keys())
+    else:
+        exchange = BithumbExchange()
+        if currencies is None:
+            currencies = BithumbExchange.TRADE_CURRENCY_TYPE
+
+    TickRecorder(exchange, exchange_name, currencies, root).run(interval)
@@ -1,15 +1,20 @@
-from keras.layers import Dense, Flatten, Input, LSTM
-from keras.optimizers import RMSprop
-from keras import backend as K
-from keras.models import Model
+# keras/tensorflow are imported where a model is built, importing this
+# module (e.g. for Env or the process actors' helpers) stays cheap
 from environment import Env
-import tensorflow as tf
+from metrics import METRICS, MetricsWriter, setup_logging
+from inference import InferenceServer
+from parameter_store import ParameterStore
+from rollout import RolloutBuffer
+import checkpoint
 import numpy as np
 import threading
+import logging
 import random
 import time
 import sys, getopt
 
+logger = logging.getLogger("m2bitcoin.a3c")
+
 # global variables for multi-threading
 global episode
 episode = 0
@@ -18,18 +23,32 @@ EPISODES = 8000000
 
 class A3CAgent:
     def __init__(self, env):
+        import tensorflow as tf
+        from keras import backend as K
+
         self.state_size = env.state_size()
+        self.history_size = env.history_size()
         self.action_size = env.action_size()
         # hyperparameters for A3C
         self.discount_factor = 0.99
+        # GAE(lambda) advantages, None uses n-step returns - values
+        self.gae_lambda = None
         self.no_op_steps = 30
         self.actor_lr = 2.5e-4
         self.critic_lr = 2.5e-4
         self.threads = 8
+        # batched get_action for all agents on the global model, 0 disables
+        self.inference_batch_size = 0
+        self.inference_wait = 0.002
+        # seconds between checkpoints, written in the background
+        self.checkpoint_interval = 60 * 10
+        self.checkpointer = checkpoint.Checkpointer('./save_model/checkpoints', keep=5)
+        # episode counter restored by restore()
+        self.start_episode = 0
         self.env = env
 
         # create policy network and value network
-        self.actor, self.critic = self.build_model(self.state_size, self.action_size)
+        self.actor, self.critic, self.model = self.build_model(self.history_size, self.state_size, self.action_size)
         # create update function
         self.optimizer = [self.actor_optimizer(), self.critic_optimizer()]
 
@@ -38,13 +57,21 @@ class A3CAgent:
         K.set_session(self.sess)
         self.sess.run(tf.global_variables_initializer())
 
-        self.summary_placeholders, self.update_ops, self.summary_op = \
-                self.setup_summary()
+        # versioned copy of the global weights agents sync from
+        self.store = ParameterStore.from_weights(self.model.get_weights())
+
         self.summary_writer = \
                 tf.summary.FileWriter('summary/m2bitcoin_a3c', self.sess.graph)
+        # agents only queue their stats, this thread writes them in batches
+        self.metrics_writer = MetricsWriter(METRICS, self.summary_writer,
+                'summary/m2bitcoin_a3c.prom')
+
+    @staticmethod
+    def build_model(history_size, state_size, action_size):
+        from keras.layers import Dense, Input, LSTM
+        from keras.models import Model
 
-    def build_model(self, state_size, action_size):
-        input = Input(shape=(1, state_size))
+        input = Input(shape=(history_size, state_size))
         d = LSTM(48, kernel_initializer='he_uniform')(input)
         # d = Dense(48, activation='relu',
         #         kernel_initializer='he_uniform')(input)
@@ -58,38 +85,70 @@ class A3CAgent:
 
         actor = Model(inputs=input, outputs=policy)
         critic = Model(inputs=input, outputs=value)
+        # policy and value from one forward pass of the shared trunk
+        model = Model(inputs=input, outputs=[policy, value])
 
         actor._make_predict_function()
         critic._make_predict_function()
+        model._make_predict_function()
 
         actor.summary()
         critic.summary()
 
-        return actor, critic
+        return actor, critic, model
 
     def train(self):
-        agents = [Agent(self.env,
-                        [self.actor, self.critic],
-                        self.sess, self.optimizer, self.discount_factor,
-                        [self.summary_op, self.summary_placeholders, self.update_ops, self.summary_writer])
+        server = None
+        if self.inference_batch_size > 0:
+            server = InferenceServer(self.model, (self.history_size, self.state_size),
+                    self.inference_batch_size, self.inference_wait)
+            server.start()
+
+        # every agent trades its own account on the shared market feed
+        agents = [Agent(self.env.fork(),
+                        [self.actor, self.critic, self.model],
+                        self.sess, self.optimizer, self.discount_factor, self.store,
+                        server.client() if server is not None else None, self.gae_lambda)
                         for _ in range(self.threads)]
 
+        self.metrics_writer.start()
+        self.checkpointer.start()
         for agent in agents:
             time.sleep(1)
             agent.start()
 
         while True:
-            time.sleep(60 * 10)
-            self.save_model("./save_model/m2bitcoin_a3c")
+            time.sleep(self.checkpoint_interval)
+            self.checkpoint()
+
+    def train_processes(self, env_kwargs, workers):
+        """
+        train with actor processes instead of threads, each builds Env(**env_kwargs)
+        """
+        from process_a3c import ProcessLearner
+        if env_kwargs.get('indicators') is not None:
+            logger.warning("indicator state lives in the actor processes, checkpoints do not save or restore it")
+        learner = ProcessLearner(self, env_kwargs, workers)
+        self.metrics_writer.start()
+        self.checkpointer.start()
+        learner.start()
+        try:
+            learner.run(EPISODES)
+        finally:
+            learner.stop()
 
     def actor_optimizer(self):
-        action = K.placeholder(shape=[None, self.action_size])
+        from keras import backend as K
+        from keras.optimizers import RMSprop
+
+        # action indices, one-hot on the graph side
+        action = K.placeholder(shape=[None, ], dtype='int32')
         advantages = K.placeholder(shape=[None, ])
 
         policy = self.actor.output
 
         # cross entropy loss function
-        action_prob = K.sum(action * policy, axis=1)
+        action_prob = K.sum(K.one_hot(action, self.action_size) * policy, axis=1)
         cross_entropy = K.log(action_prob + 1e-10) * advantages
         cross_entropy = -K.sum(cross_entropy)
 
@@ -100,12 +159,16 @@ class A3CAgent:
         loss = cross_entropy + 0.01 * entropy
 
         optimizer = RMSprop(lr=self.actor_lr, rho=0.99, epsilon=0.01)
+        self.actor_rmsprop = optimizer
         updates = optimizer.get_updates(self.actor.trainable_weights, [], loss)
         train = K.function([self.actor.input, action, advantages], [loss],
                 updates=updates)
         return train
 
     def critic_optimizer(self):
+        from keras import backend as K
+        from keras.optimizers import RMSprop
+
         discounted_prediction = K.placeholder(shape=(None,))
 
         value = self.critic.output
@@ -113,30 +176,12 @@ class A3CAgent:
         loss = K.mean(K.square(discounted_prediction - value))
 
         optimizer = RMSprop(lr=self.critic_lr, rho=0.99, epsilon=0.01)
+        self.critic_rmsprop = optimizer
         updates = optimizer.get_updates(self.critic.trainable_weights, [], loss)
         train = K.function([self.critic.input, discounted_prediction], [loss],
                 updates=updates)
         return train
 
-    def setup_summary(self):
-        episode_total_reward = tf.Variable(0.)
-        episode_avg_max_q = tf.Variable(0.)
-        episode_duration = tf.Variable(0.)
-
-        tf.summary.scalar('Total Reward/Episode', episode_total_reward)
-        tf.summary.scalar('Average Max Prob/Episode', episode_avg_max_q)
-        tf.summary.scalar('Duration/Episode', episode_duration)
-
-        summary_vars = [episode_total_reward, episode_avg_max_q,
-                episode_duration]
-
-        summary_placeholders = [tf.placeholder(tf.float32) for _ in
-                range(len(summary_vars))]
-        update_ops = [summary_vars[i].assign(summary_placeholders[i]) for i in
-                range(len(summary_vars))]
-        summary_op = tf.summary.merge_all()
-        return summary_placeholders, update_ops, summary_op
-
     def save_model(self, name):
         self.actor.save_weights(name + "_actor.h5")
         self.critic.save_weights(name + "_critic.h5")
@@ -144,28 +189,69 @@ class A3CAgent:
     def load_model(self, name):
         self.actor.load_weights(name + "_actor.h5")
         self.critic.load_weights(name + "_critic.h5")
+        self.store.publish(self.model.get_weights())
+
+    def snapshot(self, episode_count=None):
+        """
+        in-memory copy of the weights, RMSprop slots, episode counter and the
+        shared exchange's indicator state (thread mode only, actor processes
+        keep their own indicators)
+        """
+        from keras import backend as K
+
+        if episode_count is None:
+            episode_count = episode
+        state = {}
+        state['episode'] = episode_count
+        state['weights'] = self.model.get_weights()
+        state['optimizers'] = [K.batch_get_value(optimizer.weights)
+                for optimizer in (self.actor_rmsprop, self.critic_rmsprop)]
+        state['env'] = self.env.state_dict()
+        # what numpy_model needs besides the weights to run the model
+        lstm = [layer for layer in self.model.layers if layer.__class__.__name__ == "LSTM"][0]
+        config = lstm.get_config()
+        state['history_size'] = self.history_size
+        state['activations'] = (config['activation'], config['recurrent_activation'])
+        return state
+
+    def restore(self, state):
+        from keras import backend as K
+        global episode
+
+        self.model.set_weights(state['weights'])
+        for optimizer, values in zip((self.actor_rmsprop, self.critic_rmsprop), state['optimizers']):
+            K.batch_set_value(list(zip(optimizer.weights, values)))
+        self.env.load_state_dict(state['env'])
+        episode = state['episode']
+        self.start_episode = episode
+        self.store.publish(self.model.get_weights())
+
+    def checkpoint(self, episode_count=None):
+        # only the snapshot is taken here, the checkpointer thread writes it
+        self.checkpointer.snapshot(self.snapshot(episode_count))
 
 
 # actor learner(thread)
 class Agent(threading.Thread):
     def __init__(self, env, model, sess, optimizer,
-            discount_factor, summary_ops):
+            discount_factor, store, inference=None, gae_lambda=None):
         threading.Thread.__init__(self)
 
         self.env = env
         self.state_size = env.state_size()
+        self.history_size = env.history_size()
         self.action_size = env.action_size()
-        self.actor, self.critic = model
+        self.actor, self.critic, self.model = model
         self.sess = sess
         self.optimizer = optimizer
         self.discount_factor = discount_factor
-        [self.summary_op, self.summary_placeholders, self.update_ops,
-                self.summary_writer] = summary_ops
-
-        self.states, self.actions, self.rewards = [], [], []
+        self.store = store
+        self.replica = store.replica()
+        # InferenceClient of a shared InferenceServer, None predicts locally
+        self.inference = inference
 
-        self.local_actor, self.local_critic = self.build_local_model(self.state_size,
-                self.action_size)
+        self.local_model = self.build_local_model(self.history_size,
+                self.state_size, self.action_size)
 
         self.avg_p_max = 0
         self.avg_loss = 0
@@ -173,9 +259,18 @@ class Agent(threading.Thread):
         # cycle to update model
         self.t_max = 20
         self.t = 0
+        self.rollout = RolloutBuffer(self.t_max, (self.history_size, self.state_size),
+                discount_factor, gae_lambda)
+
+        # env steps taken by this agent, stop() ends run()
+        self.total_steps = 0
+        self.stopped = False
+
+    def build_local_model(self, history_size, state_size, action_size):
+        from keras.layers import Dense, Input, LSTM
+        from keras.models import Model
 
-    def build_local_model(self, state_size, action_size):
-        input = Input(shape=(1, state_size))
+        input = Input(shape=(history_size, state_size))
         d = LSTM(48, kernel_initializer='he_uniform')(input)
         # input = Input(shape=(state_size,))
         # d = Dense(48, activation='relu',
@@ -188,120 +283,125 @@ class Agent(threading.Thread):
         policy = Dense(action_size, activation='softmax')(d)
         value = Dense(1, activation='linear')(d)
 
-        local_actor = Model(inputs=input, outputs=policy)
-        local_critic = Model(inputs=input, outputs=value)
+        local_model = Model(inputs=input, outputs=[policy, value])
+        local_model._make_predict_function()
+        self.replica.sync(local_model)
+        local_model.summary()
 
-        local_actor._make_predict_function()
-        local_critic._make_predict_function()
-
-        local_actor.set_weights(self.actor.get_weights())
-        local_critic.set_weights(self.critic.get_weights())
-
-        local_actor.summary()
-        local_critic.summary()
-
-        return local_actor, local_critic
+        return local_model
 
     def run(self):
+        try:
+            self.run_episodes()
+        finally:
+            # a blocking feed would otherwise wait on this agent's full backlog
+            if self.env.feed is not None:
+                self.env.feed.close()
+
+    def run_episodes(self):
         global episode
         env = self.env
 
         step = 0
 
-        while episode < EPISODES:
+        while episode < EPISODES and not self.stopped:
             done = False
             score = 0
 
             state = env.reset()
+            # (policy, value) of state when already predicted
+            prediction = None
 
-            while not done:
+            while not done and not self.stopped:
                 step += 1
                 self.t += 1
-                action, policy = self.get_action(state)
+                self.total_steps += 1
+                action, policy, value = self.get_action(state, prediction)
+                prediction = None
                 # print("action -> ", action)
                 # print("policy -> ", policy)
 
                 next_state, reward, done, info = env.step(action)
 
-                # self.avg_p_max += np.amax(self.actor.predict(next_state.reshape((1, self.state_size))))
-                self.avg_p_max += np.amax(self.actor.predict(next_state.reshape((1, 1, self.state_size))))
+                self.avg_p_max += np.amax(policy)
 
                 score += reward
                 reward = np.clip(reward, -1., 1.)
                 
-                self.append_sample(state, action, reward)
+                self.append_sample(state, action, reward, value, done)
 
                 state = next_state
 
                 if self.t >= self.t_max or done:
-                    self.train_model(done)
-                    self.update_local_model()
+                    bootstrap = 0.0
+                    if not done:
+                        # V(next_state), its policy picks the next action
+                        prediction = self.predict(next_state)
+                        bootstrap = prediction[1]
+
+                    started = time.perf_counter()
+                    self.train_model(bootstrap)
+                    trained = time.perf_counter()
+                    # the inference server already predicts with the global model
+                    if self.inference is None:
+                        self.update_local_model()
+                    METRICS.observe("train", trained - started)
+                    METRICS.observe("sync", time.perf_counter() - trained)
                     self.t = 0
 
                 if done:
                     episode += 1
-                    print("episode:", episode, " score:", score, " step:", step)
-
-                    stats = [score, self.avg_p_max / float(step), step]
-                    for i in range(len(stats)):
-                        self.sess.run(self.update_ops[i], feed_dict={
-                            self.summary_placeholders[i]: float(stats[i])
-                        })
-                    summary_str = self.sess.run(self.summary_op)
-                    self.summary_writer.add_summary(summary_str, episode + 1)
+                    logger.info("episode: %d score: %s step: %d", episode, score, step)
+
+                    METRICS.summary('Total Reward/Episode', score, episode + 1)
+                    METRICS.summary('Average Max Prob/Episode', self.avg_p_max / float(step), episode + 1)
+                    METRICS.summary('Duration/Episode', step, episode + 1)
                     self.avg_p_max = 0
                     self.avg_loss = 0
                     step = 0
 
-    # calculate n-step prediction
-    def discounted_prediction(self, rewards, done):
-        discounted_prediction = np.zeros_like(rewards)
-        running_add = 0
-
-        if not done:
-            # running_add = self.critic.predict(self.states[-1].reshape(1, self.state_size))[0]
-            running_add = self.critic.predict(self.states[-1].reshape(1, 1, self.state_size))[0]
-
-        for t in reversed(range(0, len(rewards))):
-            running_add = running_add * self.discount_factor + rewards[t]
-            discounted_prediction[t] = running_add
-        
-        return discounted_prediction
+    def stop(self):
+        self.stopped = True
 
     # update actor,critic neural network
-    def train_model(self, done):
-        discounted_prediction = self.discounted_prediction(self.rewards, done)
-
-        states = np.zeros((len(self.states), 1, self.state_size))
-        for i in range(len(self.states)):
-            states[i] = self.states[i].reshape(1, self.state_size)
-
-        values = self.critic.predict(states)
-        values = np.reshape(values, len(values))
-
-        advantages = discounted_prediction - values
-
-        self.optimizer[0]([states, self.actions, advantages])
-        self.optimizer[1]([states, discounted_prediction])
-        self.states, self.actions, self.rewards = [], [], []
-
-    # update local network by global network
+    # bootstrap: V(next_state) of the last step, 0 at the end of an episode
+    def train_model(self, bootstrap):
+        rollout = self.rollout
+        n = len(rollout)
+        discounted_prediction, advantages = rollout.compute(bootstrap)
+
+        self.optimizer[0]([rollout.states[:n], rollout.actions[:n], advantages])
+        self.optimizer[1]([rollout.states[:n], discounted_prediction])
+        self.store.publish(self.model.get_weights())
+        rollout.clear()
+
+    # update local network by global network, skipped if no agent trained since the last sync
     def update_local_model(self):
-        self.local_actor.set_weights(self.actor.get_weights())
-        self.local_critic.set_weights(self.critic.get_weights())
-
-    def get_action(self, state):
-        # policy = self.local_actor.predict(state.reshape(1, self.state_size))[0]
-        policy = self.local_actor.predict(state.reshape(1, 1, self.state_size))[0]
+        return self.replica.sync(self.local_model)
+
+    def predict(self, state):
+        """
+        return policy, value(float) of state
+        """
+        started = time.perf_counter()
+        if self.inference is not None:
+            policy, value = self.inference.predict(state)
+        else:
+            policy, value = self.local_model.predict(state.reshape(1, self.history_size, self.state_size))
+            policy, value = policy[0], value[0]
+        METRICS.observe("inference", time.perf_counter() - started)
+        return policy, float(value[0])
+
+    def get_action(self, state, prediction=None):
+        if prediction is None:
+            prediction = self.predict(state)
+        policy, value = prediction
         action_index = np.random.choice(self.action_size, 1, p=policy)[0]
-        return action_index, policy
+        return action_index, policy, value
 
-    def append_sample(self, state, action, reward):
-        self.states.append(state.reshape(1, self.state_size))
-        act = np.zeros(self.action_size)
-        act[action] = 1
-        self.actions.append(act)
-        self.rewards.append(reward)
+    def append_sample(self, state, action, reward, value, done=False):
+        # copied into the preallocated rollout, env may reuse its state buffers
+        self.rollout.append(state, action, reward, value, done)
 
 
 # TRADE_CURRENCY_TYPE = ["BTC", "ETH", "DASH", "LTC", "ETC", "XRP", "BCH",
@@ -309,18 +409,82 @@ class Agent(threading.Thread):
 #         "MITH"]
 # -e Bithumb ...
 # -c BTC
+# -e Replay -f capture.jsonl [-s speed]
+# -d 20 (orderbook depth levels)
+# -i (technical indicators)
+# -k 16 (LSTM input history length)
+# -l DEBUG (log level)
+# -n 100 (log one in n records below INFO)
+# -p 8 (actor processes instead of threads)
+# -b 8 -w 2 (batched inference, max batch size and max wait in ms)
+# -g 0.95 (GAE lambda)
+# --resume (continue from the newest checkpoint)
 if __name__ == "__main__":
-    myopts, args = getopt.getopt(sys.argv[1:], "c:e:")
+    myopts, args = getopt.getopt(sys.argv[1:], "c:e:f:s:d:ik:l:n:p:b:w:g:", ["resume"])
     exchange = 'Bithumb'
     currency = 'BTC'
+    capture = None
+    speed = 0.0
+    depth_levels = 0
+    indicators = None
+    history = 1
+    log_level = 'INFO'
+    sample_every = 1
+    processes = 0
+    inference_batch_size = 0
+    inference_wait = 0.002
+    gae_lambda = None
+    resume = False
 
     for o, a in myopts:
         if o == '-e':
             exchange = a
         elif o == '-c':
             currency = a
+        elif o == '-f':
+            capture = a
+        elif o == '-s':
+            speed = float(a)
+        elif o == '-d':
+            depth_levels = int(a)
+        elif o == '-i':
+            indicators = {}
+        elif o == '-k':
+            history = int(a)
+        elif o == '-l':
+            log_level = a.upper()
+        elif o == '-n':
+            sample_every = int(a)
+        elif o == '-p':
+            processes = int(a)
+        elif o == '-b':
+            inference_batch_size = int(a)
+        elif o == '-w':
+            inference_wait = float(a) / 1000
+        elif o == '-g':
+            gae_lambda = float(a)
+        elif o == '--resume':
+            resume = True
         else:
-            print("Usage: %s -e exchange -c currency" % sys.argv[0])
-
-    global_agent = A3CAgent(Env(5000*10000, exchange=exchange, currency=currency, percent_per_trade=0.01))
-    global_agent.train()
+            print("Usage: %s -e exchange -c currency [-f capture -s speed] [-d depth_levels] [-i] [-k history] [-l level -n sample_every] [-p processes] [-b batch_size -w wait_ms] [-g gae_lambda] [--resume]" % sys.argv[0])
+
+    setup_logging(getattr(logging, log_level), sample_every)
+
+    env_kwargs = dict(initial_investment=5000*10000, exchange=exchange, currency=currency,
+        percent_per_trade=0.01, capture=capture, speed=speed, depth_levels=depth_levels,
+        indicators=indicators, history=history)
+    global_agent = A3CAgent(Env(**env_kwargs))
+    global_agent.inference_batch_size = inference_batch_size
+    global_agent.inference_wait = inference_wait
+    global_agent.gae_lambda = gae_lambda
+    if resume:
+        path = checkpoint.latest(global_agent.checkpointer.directory)
+        if path is None:
+            logger.warning("no checkpoint to resume from, starting fresh")
+        else:
+            global_agent.restore(checkpoint.load(path))
+            logger.info("resumed from %s episode %d", path, episode)
+    if processes > 0:
+        global_agent.train_processes(env_kwargs, processes)
+    else:
+        global_agent.train()
@@ -0,0 +1,190 @@
+import numpy as np
+from environment import BUY, SELL
+from replay import ReplayExchange
+from schema import STATE_DTYPE
+
+
+class VectorEnv():
+    """
+    Runs num_envs independent portfolios over historical data at once.
+
+    prices: (T,) trade price at each step (Env.current_price)
+    features: (T, F) exchange states at each step (what exchange.get_states returns)
+
+    Every member has its own cursor into the data and follows the same
+    accounting as Env.buy/Env.sell/Env.fixup_reward. Members that finish are
+    reset to a new random cursor inside step(), so the returned states of a
+    done member are already the first states of its next episode.
+    """
+    def __init__(self, prices, features, num_envs, initial_investment,
+            percent_per_trade=0.05, fee_percent=0.15, min_steps=100, seed=None):
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.features = np.asarray(features, dtype=STATE_DTYPE)
+        if len(self.prices) != len(self.features):
+            raise Exception('prices and features length mismatch')
+        if len(self.prices) <= min_steps:
+            raise Exception('Not enough data for min_steps')
+
+        self.num_envs = num_envs
+        self.initial_investment = initial_investment
+        self.cash_per_trade = initial_investment * percent_per_trade
+        self.fee_percent = fee_percent
+        self.min_steps = min_steps
+        self.random = np.random.RandomState(seed)
+
+        n = num_envs
+        self.cursor = np.zeros(n, dtype=np.int64)
+        self.cash_asset = np.zeros(n)
+        self.average_cost = np.zeros(n)
+        self.buy_count = np.zeros(n)
+        self.current_price = np.zeros(n)
+        self.earning_rate = np.zeros(n)
+        self.fee_sum = np.zeros(n)
+        self.done = np.zeros(n, dtype=bool)
+
+        self.states_size = self.features.shape[1] + 1
+        self.states = np.zeros((n, self.states_size), dtype=STATE_DTYPE)
+
+    @classmethod
+    def from_capture(cls, capture_path, currency, num_envs, initial_investment, **kwargs):
+        """
+        build prices/features from a ReplayExchange capture file
+        """
+        exchange = ReplayExchange(capture_path, loop=False)
+        frames = exchange.frames[currency]
+
+        prices = np.zeros(len(frames))
+        features = exchange.STATE_SCHEMA.allocate(len(frames))
+        for i, frame in enumerate(frames):
+            prices[i], _ = exchange.build_states(frame['ticker'], frame['recent'], features[i])
+
+        kwargs.setdefault('fee_percent', exchange.get_fee())
+        return cls(prices, features, num_envs, initial_investment, **kwargs)
+
+    def state_size(self):
+        return self.states_size
+
+    def action_size(self):
+        # 0: do nothing, 1: buy, 2: sell
+        return 3
+
+    def reset(self, mask=None):
+        """
+        reset members in mask (all if None)
+        return states (num_envs, state_size)
+        """
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        count = int(np.count_nonzero(mask))
+        if count > 0:
+            high = len(self.prices) - self.min_steps
+            self.cursor[mask] = self.random.randint(0, high, size=count)
+            self.cash_asset[mask] = self.initial_investment
+            self.average_cost[mask] = 0
+            self.buy_count[mask] = 0.0
+            self.earning_rate[mask] = 0.0
+            self.fee_sum[mask] = 0
+            self.done[mask] = False
+            self.current_price[mask] = self.prices[self.cursor[mask]]
+            self.make_states(mask)
+        return self.states
+
+    def make_states(self, mask=None):
+        """
+        write the states of members in mask (all if None) at their cursor
+        """
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        features_size = self.states_size - 1
+        self.states[mask, :features_size] = self.features[self.cursor[mask]]
+        # average_cost
+        val = np.divide(self.average_cost[mask], self.current_price[mask])
+        val[self.average_cost[mask] <= 0] = 0.0
+        self.states[mask, features_size] = val
+
+    def buy(self, mask):
+        cash_trade = np.where(self.cash_asset > self.cash_per_trade, self.cash_per_trade, self.cash_asset)
+
+        fee_per_unit = self.current_price * self.fee_percent * 0.01
+        real_price = self.current_price + fee_per_unit
+
+        buy_count = np.floor(cash_trade / real_price * 100) / 100
+
+        buy_price = np.trunc(buy_count * real_price)
+        fee = np.trunc(buy_count * fee_per_unit)
+
+        ok = mask & (buy_count > 0)
+        failed = mask & ~(buy_count > 0) & (self.buy_count <= 0)
+
+        total_buy_cost = self.buy_count * self.average_cost + real_price * buy_count
+        new_count = np.floor((self.buy_count + buy_count) * 100) / 100
+        average_cost = np.trunc(np.divide(total_buy_cost, new_count,
+                out=np.zeros_like(total_buy_cost), where=new_count > 0))
+
+        self.cash_asset = np.where(ok, self.cash_asset - buy_price, self.cash_asset)
+        self.buy_count = np.where(ok, new_count, self.buy_count)
+        self.average_cost = np.where(ok, average_cost, self.average_cost)
+        self.fee_sum = np.where(ok, self.fee_sum + fee, self.fee_sum)
+        self.done |= failed
+
+    def sell(self, mask):
+        sell_count = self.cash_per_trade / self.current_price
+        sell_count = np.minimum(sell_count, self.buy_count)
+        sell_count = np.floor(sell_count * 100) / 100
+
+        sell_price = np.trunc(sell_count * self.current_price)
+
+        ok = mask & (sell_count > 0)
+        failed = mask & ~(sell_count > 0) & (self.cash_asset <= 0)
+
+        new_count = np.floor((self.buy_count - sell_count) * 100) / 100
+        emptied = ok & (new_count <= 0)
+
+        self.buy_count = np.where(ok, new_count, self.buy_count)
+        self.cash_asset = np.where(ok, self.cash_asset + sell_price, self.cash_asset)
+        self.buy_count[emptied] = 0.0
+        self.average_cost[emptied] = 0
+        self.done |= failed
+
+    def fixup_reward(self, mask):
+        earning_rate = ((self.current_price * self.buy_count + self.cash_asset) - self.initial_investment) / self.initial_investment
+        reward = np.where(self.earning_rate != 0, earning_rate - self.earning_rate, earning_rate)
+        reward[~mask] = 0.0
+        self.earning_rate = np.where(mask, earning_rate, self.earning_rate)
+        return reward
+
+    def step(self, actions):
+        """
+        actions: (num_envs,) of DO_NOTHING/BUY/SELL
+        return states(num_envs, state_size), rewards(num_envs), dones(num_envs), info(dict)
+        """
+        actions = np.asarray(actions)
+
+        self.cursor += 1
+        # running out of data ends the episode
+        exhausted = self.cursor >= len(self.prices)
+        self.cursor[exhausted] = len(self.prices) - 1
+        self.current_price = self.prices[self.cursor]
+        # like Env.step, the states are read before this step's trade
+        self.make_states()
+
+        buy = actions == BUY
+        sell = actions == SELL
+        self.buy(buy)
+        self.sell(sell)
+        rewards = self.fixup_reward(buy | sell)
+
+        self.done |= self.earning_rate < -0.03
+        self.done |= exhausted
+        dones = self.done.copy()
+
+        info = {}
+        info['total_asset'] = self.cash_asset + self.average_cost * self.buy_count
+        info['earning_rate'] = self.earning_rate.copy()
+        info['fee_sum'] = self.fee_sum.copy()
+
+        # auto reset finished members
+        if dones.any():
+            self.reset(dones)
+
+        return self.states.copy(), rewards, dones, info